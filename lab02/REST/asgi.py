@@ -0,0 +1,99 @@
+import argparse
+import asyncio
+
+from quart import Quart, request, jsonify, send_file
+
+import service
+from storage import StorageError
+
+# ASGI variant of main.py with the same routes and JSON contract, served by an event loop.
+# Handlers that may block (durable writes, file uploads) run in worker threads, images are
+# streamed by Quart with non-blocking file reads.
+#
+# The catalogue lives in process memory, so the service runs as a single worker process:
+# concurrency comes from the event loop instead of one thread per request.
+app = Quart(__name__)
+
+@app.errorhandler(404)
+async def resource_not_found(e):
+    return jsonify(error=str(e)), 404
+
+@app.errorhandler(400)
+async def bad_request(e):
+    return jsonify(error=str(e)), 400
+
+@app.errorhandler(StorageError)
+async def storage_failed(e):
+    return jsonify(error=str(e)), 503
+
+@app.route('/')
+async def home():
+    return jsonify(message="Welcome to AmEl shop REST service. Checkout the docs for more info.")
+
+@app.route('/product', methods=['POST'])
+async def add_product():
+    return await asyncio.to_thread(service.add_product, await request.get_json())
+
+@app.route('/product/<int:product_id>', methods=['GET'])
+async def get_product_by_id(product_id: int):
+    return service.get_product(product_id)
+
+@app.route('/product/<int:product_id>', methods=['PUT'])
+async def update_product(product_id: int):
+    return await asyncio.to_thread(service.update_product, product_id, await request.get_json())
+
+@app.route('/product/<int:product_id>', methods=['DELETE'])
+async def delete_product(product_id: int):
+    return await asyncio.to_thread(service.delete_product, product_id)
+
+@app.route('/products', methods=['GET'])
+async def get_products():
+    return service.list_products(request.args, request.query_string, request.if_none_match)
+
+@app.route('/products/search', methods=['GET'])
+async def search_products():
+    return service.search_products(request.args)
+
+@app.route('/products/batch', methods=['POST'])
+async def add_products():
+    return await asyncio.to_thread(service.add_products, await request.get_json(silent=True))
+
+@app.route('/products/batch', methods=['PATCH'])
+async def update_products():
+    return await asyncio.to_thread(service.update_products, await request.get_json(silent=True))
+
+@app.route('/products/batch', methods=['DELETE'])
+async def delete_products():
+    return await asyncio.to_thread(service.delete_products, await request.get_json(silent=True))
+
+@app.route('/product/<int:product_id>/image', methods=['POST'])
+async def upload_image(product_id: int):
+    icon = service.get_icon(product_id, await request.files)
+    return await asyncio.to_thread(service.save_icon, product_id, icon)
+
+@app.route('/product/<int:product_id>/image', methods=['GET'])
+async def get_image(product_id: int):
+    icon_path, mime_type, icon_hash = service.get_icon_file(product_id)
+    response = await send_file(icon_path, mimetype=mime_type or 'application/octet-stream', add_etags=not icon_hash)
+    if icon_hash:
+        response.set_etag(icon_hash)
+    # Answers If-None-Match/If-Modified-Since with 304 and serves Range requests
+    return await response.make_conditional(request, accept_ranges=True, complete_length=response.content_length)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="ASGI server for the lab02 REST service")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to listen on")
+    parser.add_argument("--port", type=int, default=5000, help="Port to listen on")
+    parser.add_argument(
+        "--log_level",
+        default="info",
+        choices=["debug", "info", "warning", "error", "critical"],
+        help="Set the logging level",
+    )
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    import uvicorn
+
+    args = parse_arguments()
+    uvicorn.run(app, host=args.host, port=args.port, log_level=args.log_level)
@@ -0,0 +1,79 @@
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+import uuid
+
+from product import Product, dump_products
+
+
+# The previous Product: a plain class with a per-instance __dict__
+class DictProduct:
+    def __init__(self, name, description, icon="", icon_hash=""):
+        self.id = uuid.uuid4().int
+        self.name = name
+        self.description = description
+        self.icon = icon
+        self.icon_hash = icon_hash
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Product model memory/throughput benchmark")
+    parser.add_argument("--count", type=int, default=1_000_000, help="Number of products")
+    parser.add_argument(
+        "--memory_sample",
+        type=int,
+        default=100_000,
+        help="Number of products traced for memory usage (tracing is slow)",
+    )
+    return parser.parse_args()
+
+
+def make_products(product_cls, count):
+    return [product_cls(f"Product {i}", f"Description of product {i}") for i in range(count)]
+
+
+# Bytes allocated per product, including its id and strings
+def measure_memory(product_cls, count):
+    gc.collect()
+    tracemalloc.start()
+    items = make_products(product_cls, count)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del items
+    return size / count
+
+
+def measure_time(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def format_size(size):
+    return f"{size / 1024 ** 2:.1f} MB"
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    print(f"Benchmarking {args.count} products")
+
+    sample = min(args.count, args.memory_sample)
+    dict_size = measure_memory(DictProduct, sample)
+    slot_size = measure_memory(Product, sample)
+    print(
+        f"Memory: __dict__ {dict_size:.0f} B/product ({format_size(dict_size * args.count)} total), "
+        f"__slots__ {slot_size:.0f} B/product ({format_size(slot_size * args.count)} total)"
+    )
+
+    dict_items = make_products(DictProduct, args.count)
+    slot_items = make_products(Product, args.count)
+
+    dict_body, dict_time = measure_time(lambda: json.dumps([p.__dict__ for p in dict_items]))
+    slot_body, slot_time = measure_time(lambda: dump_products(slot_items))
+    print(
+        f"Serialization: json.dumps(__dict__) {dict_time:.2f} s ({args.count / dict_time:,.0f} products/s), "
+        f"dump_products {slot_time:.2f} s ({args.count / slot_time:,.0f} products/s)"
+    )
+    print(f"Payload: {format_size(len(slot_body))}")
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+
+CHUNK_SIZE = 64 * 1024
+BLOB_NAME = re.compile(r"^[0-9a-f]{64}(\.[0-9a-z]+)?$")
+EXTENSION = re.compile(r"^\.[0-9a-z]+$")
+STALE_UPLOAD_AGE = 3600
+
+
+# Content-addressed file storage: every blob is saved as <sha256><extension>,
+# so identical uploads share one file. Blobs are reference-counted by path and
+# removed from disk once the last reference is released
+class BlobStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._refs = {}  # path -> number of references
+        self._lock = threading.Lock()
+
+    # Stream `stream` to disk while hashing it and return (path, digest).
+    # The returned blob holds one reference, release it once the blob is attached
+    def save(self, stream, extension=""):
+        extension = extension.lower()
+        if not EXTENSION.match(extension):
+            extension = ""
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                while chunk := stream.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    tmp.write(chunk)
+
+            path = os.path.join(self.directory, digest.hexdigest() + extension)
+            with self._lock:
+                if os.path.exists(path):
+                    os.remove(tmp_path)
+                else:
+                    os.replace(tmp_path, path)
+                self._refs[path] = self._refs.get(path, 0) + 1
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path, digest.hexdigest()
+
+    def is_blob(self, path):
+        return isinstance(path, str) and bool(path) and (
+            os.path.dirname(path) == self.directory
+            and BLOB_NAME.match(os.path.basename(path)) is not None
+        )
+
+    def acquire(self, path):
+        if not self.is_blob(path):
+            return
+        with self._lock:
+            self._refs[path] = self._refs.get(path, 0) + 1
+
+    def release(self, path):
+        if not self.is_blob(path):
+            return
+        with self._lock:
+            count = self._refs.get(path, 0) - 1
+            if count > 0:
+                self._refs[path] = count
+                return
+            self._refs.pop(path, None)
+            if os.path.exists(path):
+                os.remove(path)
+
+    # Remove unreferenced blobs and partial uploads left over from a previous run
+    def collect_garbage(self):
+        now = time.time()
+        with self._lock:
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if name.endswith(".part"):
+                    if now - os.path.getmtime(path) > STALE_UPLOAD_AGE:
+                        os.remove(path)
+                elif self.is_blob(path) and path not in self._refs:
+                    os.remove(path)
+
+    def ref_count(self, path):
+        return self._refs.get(path, 0)
+
+    # Store listener keeping reference counts in sync with the products' icons
+    def track(self, before, after):
+        old_icon = before["icon"] if before else ""
+        new_icon = after["icon"] if after else ""
+        if old_icon != new_icon:
+            self.acquire(new_icon)
+            self.release(old_icon)
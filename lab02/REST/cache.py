@@ -0,0 +1,51 @@
+import threading
+import uuid
+import zlib
+from collections import OrderedDict
+
+
+# Cache of rendered listing responses, valid for one store generation.
+# The generation is bumped by every store mutation, which drops all cached bodies
+class ListingCache:
+    def __init__(self, max_entries=64, max_size=128 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.generation = 0
+        # Distinguishes generations of different processes, so ETags survive restarts
+        self._instance = uuid.uuid4().hex[:8]
+        self._entries = OrderedDict()  # (generation, key) -> (value, size)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    # Store listener
+    def invalidate(self, before=None, after=None):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._size = 0
+
+    def etag(self, key, generation):
+        return f"{self._instance}-{generation}-{zlib.crc32(key):08x}"
+
+    def get(self, key, generation):
+        with self._lock:
+            entry = self._entries.get((generation, key))
+            if entry is None:
+                return None
+            self._entries.move_to_end((generation, key))
+            return entry[0]
+
+    # `generation` is the one read before rendering `value`, a value rendered while
+    # the store was being modified is never stored for the newer generation
+    def put(self, key, generation, value, size):
+        with self._lock:
+            if generation != self.generation or size > self.max_size:
+                return
+            previous = self._entries.pop((generation, key), None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._entries[(generation, key)] = (value, size)
+            self._size += size
+            while len(self._entries) > self.max_entries or self._size > self.max_size:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
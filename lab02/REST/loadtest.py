@@ -0,0 +1,289 @@
+import argparse
+import atexit
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+# Load test for the REST service: starts the app in its own process (or targets --url),
+# seeds products and drives a weighted mix of requests from concurrent clients, then
+# reports throughput and latency percentiles per route
+
+DEFAULT_MIX = "get=40,list=20,search=5,create=10,update=10,delete=5,image_get=5,image_upload=5"
+ICON = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 16
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Load test for the lab02 REST service")
+    parser.add_argument("--url", help="Test a running service instead of starting one")
+    parser.add_argument("--server", choices=["wsgi", "asgi"], default="wsgi", help="App to start")
+    parser.add_argument("--port", type=int, default=5055, help="Port for the started app")
+    parser.add_argument("--products", type=int, default=10000, help="Products to seed")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    parser.add_argument("--requests", type=int, help="Stop after this many requests")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Route weights, e.g. get=3,list=1")
+    return parser.parse_args()
+
+
+def parse_mix(mix):
+    weights = {}
+    for item in mix.split(","):
+        route, _, weight = item.partition("=")
+        if route not in ROUTES:
+            raise ValueError(f"Unknown route in mix: {route}")
+        weights[route] = float(weight or 1)
+    return list(weights), list(weights.values())
+
+
+# Starts the app in a separate process, so the server does not share the GIL with the
+# clients and the measured latencies are the server's. It is stopped when the test exits
+def start_server(server, port):
+    # Keep test data out of the service's own folders, unless they are set explicitly
+    env = dict(os.environ)
+    for variable in ("STORAGE_FOLDER", "UPLOAD_FOLDER"):
+        if variable not in env:
+            env[variable] = tempfile.mkdtemp(prefix="loadtest-")
+            atexit.register(shutil.rmtree, env[variable], True)
+
+    if server == "wsgi":
+        # Without werkzeug's access log, which would bury the report and cost server CPU
+        command = [
+            "-c",
+            "import logging; logging.getLogger('werkzeug').setLevel(logging.WARNING); "
+            f"from main import app; app.run('127.0.0.1', {port}, threaded=True)",
+        ]
+    else:
+        command = ["asgi.py", "--host", "127.0.0.1", "--port", str(port), "--log_level", "warning"]
+    process = subprocess.Popen(
+        [sys.executable, *command],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    # Registered after the folders, so the app shuts down before they are removed
+    atexit.register(stop_server, process)
+
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/")
+            connection.getresponse().read()
+            return f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("Server did not start")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+# Product ids known to exist, shared by all clients
+class ProductPool:
+    def __init__(self):
+        self._ids = []
+        self._lock = threading.Lock()
+
+    def add(self, product_id):
+        with self._lock:
+            self._ids.append(product_id)
+
+    def pick(self):
+        with self._lock:
+            return random.choice(self._ids) if self._ids else None
+
+    def take(self):
+        with self._lock:
+            if not self._ids:
+                return None
+            i = random.randrange(len(self._ids))
+            self._ids[i], self._ids[-1] = self._ids[-1], self._ids[i]
+            return self._ids.pop()
+
+
+class Client:
+    def __init__(self, host, port, pool, icons):
+        self.connection = http.client.HTTPConnection(host, port, timeout=30)
+        self.pool = pool
+        self.icons = icons  # products that got an icon uploaded
+
+    def request(self, method, path, body=None, headers=None):
+        try:
+            self.connection.request(method, path, body=body, headers=headers or {})
+            response = self.connection.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            self.connection.close()
+            raise
+        if response.getheader("Connection", "").lower() == "close":
+            self.connection.close()
+        return response.status, data
+
+    def request_json(self, method, path, payload):
+        return self.request(method, path, json.dumps(payload), {"Content-Type": "application/json"})
+
+
+def run_create(client):
+    status, data = client.request_json("POST", "/product", {"name": "Load test", "description": "Created"})
+    if status == 201:
+        client.pool.add(json.loads(data)["id"])
+    return status
+
+
+def run_get(client):
+    return client.request("GET", f"/product/{client.pool.pick()}")[0]
+
+
+def run_list(client):
+    return client.request("GET", "/products?limit=50")[0]
+
+
+def run_search(client):
+    return client.request("GET", f"/products/search?q=item+{random.randrange(100)}")[0]
+
+
+def run_update(client):
+    payload = {"description": f"Updated {random.random()}"}
+    return client.request_json("PUT", f"/product/{client.pool.pick()}", payload)[0]
+
+
+def run_delete(client):
+    return client.request("DELETE", f"/product/{client.pool.take()}")[0]
+
+
+def run_image_get(client):
+    product_id = client.icons.pick() or client.pool.pick()
+    return client.request("GET", f"/product/{product_id}/image")[0]
+
+
+def run_image_upload(client):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="icon"; filename="icon.png"\r\n'
+        f"Content-Type: image/png\r\n\r\n"
+    ).encode() + ICON + f"\r\n--{boundary}--\r\n".encode()
+    headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    product_id = client.pool.pick()
+    status = client.request("POST", f"/product/{product_id}/image", body, headers)[0]
+    if status == 200:
+        client.icons.add(product_id)
+    return status
+
+
+ROUTES = {
+    "create": run_create,
+    "get": run_get,
+    "list": run_list,
+    "search": run_search,
+    "update": run_update,
+    "delete": run_delete,
+    "image_get": run_image_get,
+    "image_upload": run_image_upload,
+}
+
+
+def seed(client, count):
+    for start in range(0, count, 5000):
+        batch = [
+            {"name": f"Item {i % 100}", "description": f"Seeded product number {i}"}
+            for i in range(start, min(count, start + 5000))
+        ]
+        status, data = client.request_json("POST", "/products/batch", batch)
+        if status != 200:
+            raise RuntimeError(f"Seeding failed with status {status}")
+        for result in json.loads(data):
+            client.pool.add(result["product"]["id"])
+    for _ in range(min(count, 100)):
+        run_image_upload(client)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def run_load(host, port, pool, icons, routes, weights, clients, duration, max_requests):
+    results = {route: [] for route in routes}  # route -> [(status, latency)]
+    lock = threading.Lock()
+    sent = [0]
+    deadline = time.monotonic() + duration
+
+    def worker():
+        client = Client(host, port, pool, icons)
+        local = {route: [] for route in routes}
+        while time.monotonic() < deadline:
+            with lock:
+                if max_requests is not None and sent[0] >= max_requests:
+                    break
+                sent[0] += 1
+            route = random.choices(routes, weights)[0]
+            start = time.perf_counter()
+            try:
+                status = ROUTES[route](client)
+            except (http.client.HTTPException, OSError):
+                status = 0
+            local[route].append((status, time.perf_counter() - start))
+        with lock:
+            for route, samples in local.items():
+                results[route].extend(samples)
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.monotonic() - start
+
+
+def print_report(results, elapsed):
+    print(f"{'route':<14}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    total = 0
+    for route, samples in results.items():
+        if not samples:
+            continue
+        latencies = sorted(latency * 1000 for _, latency in samples)
+        # 404s are expected when a product was deleted by another client in between
+        errors = sum(1 for status, _ in samples if status == 0 or status >= 500)
+        total += len(samples)
+        print(
+            f"{route:<14}{len(samples):>10}{errors:>8}{len(samples) / elapsed:>10.1f}"
+            f"{percentile(latencies, 50):>10.2f}{percentile(latencies, 95):>10.2f}{percentile(latencies, 99):>10.2f}"
+        )
+    print(f"Total: {total} requests in {elapsed:.2f} s, {total / elapsed:.1f} req/s")
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    routes, weights = parse_mix(args.mix)
+
+    url = args.url or start_server(args.server, args.port)
+    parsed = urlparse(url)
+    host, port = parsed.hostname, parsed.port or 80
+
+    pool, icons = ProductPool(), ProductPool()
+    print(f"Seeding {args.products} products at {url}...")
+    seed(Client(host, port, pool, icons), args.products)
+
+    print(f"Running {args.clients} clients for {args.duration} s...")
+    results, elapsed = run_load(
+        host, port, pool, icons, routes, weights, args.clients, args.duration, args.requests
+    )
+    print_report(results, elapsed)
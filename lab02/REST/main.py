@@ -1,20 +1,9 @@
-import uuid
-from flask import Flask, request, jsonify, abort, send_file
-import os
-import mimetypes
+from flask import Flask, request, jsonify, send_file
 
-app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = os.path.join(app.root_path, 'images')
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-class Product:
-    def __init__(self, name, description, icon=""):
-        self.id = uuid.uuid4().int
-        self.name = name
-        self.description = description
-        self.icon = icon
+import service
+from storage import StorageError
 
-products: list[Product] = []
+app = Flask(__name__)
 
 @app.errorhandler(404)
 def resource_not_found(e):
@@ -24,79 +13,60 @@ def resource_not_found(e):
 def bad_request(e):
     return jsonify(error=str(e)), 400
 
+@app.errorhandler(StorageError)
+def storage_failed(e):
+    return jsonify(error=str(e)), 503
+
 @app.route('/')
 def home():
     return jsonify(message="Welcome to AmEl shop REST service. Checkout the docs for more info.")
 
 @app.route('/product', methods=['POST'])
 def add_product():
-    data = request.get_json()
-    if not data or 'name' not in data or 'description' not in data:
-        abort(400, description="Missing required fields: name and description")
-    product = Product(data['name'], data['description'])
-    products.append(product)
-    return jsonify(product.__dict__), 201
+    return service.add_product(request.get_json())
 
 @app.route('/product/<int:product_id>', methods=['GET'])
 def get_product_by_id(product_id: int):
-    for product in products:
-        if product.id == product_id:
-            return jsonify(product.__dict__)
-    abort(404, description="Product not found")
+    return service.get_product(product_id)
 
 @app.route('/product/<int:product_id>', methods=['PUT'])
 def update_product(product_id: int):
-    data = request.get_json()
-    if not data:
-        abort(400, description="Invalid or missing JSON data")
-    for product in products:
-        if product.id == product_id:
-            if 'name' in data:
-                product.name = data['name']
-            if 'description' in data:
-                product.description = data['description']
-            if 'icon' in data:
-                product.icon = data['icon']
-            return jsonify(product.__dict__)
-    abort(404, description="Product not found")
+    return service.update_product(product_id, request.get_json())
 
 @app.route('/product/<int:product_id>', methods=['DELETE'])
 def delete_product(product_id: int):
-    for product in products:
-        if product.id == product_id:
-            products.remove(product)
-            return jsonify(product.__dict__)
-    abort(404, description="Product not found")
+    return service.delete_product(product_id)
 
 @app.route('/products', methods=['GET'])
 def get_products():
-    return jsonify([product.__dict__ for product in products])
+    return service.list_products(request.args, request.query_string, request.if_none_match)
+
+@app.route('/products/search', methods=['GET'])
+def search_products():
+    return service.search_products(request.args)
+
+@app.route('/products/batch', methods=['POST'])
+def add_products():
+    return service.add_products(request.get_json(silent=True))
+
+@app.route('/products/batch', methods=['PATCH'])
+def update_products():
+    return service.update_products(request.get_json(silent=True))
+
+@app.route('/products/batch', methods=['DELETE'])
+def delete_products():
+    return service.delete_products(request.get_json(silent=True))
 
 @app.route('/product/<int:product_id>/image', methods=['POST'])
 def upload_image(product_id: int):
-    for product in products:
-        if product.id == product_id:
-            if 'icon' not in request.files:
-                abort(400, description="No icon part in the request")
-            icon = request.files['icon']
-            if icon.filename == '':
-                abort(400, description="No selected file")
-
-            icon_path = os.path.join(app.config['UPLOAD_FOLDER'], icon.filename)
-            icon.save(icon_path)
-            product.icon = icon_path
-            return jsonify(product.__dict__)
-    abort(404, description="Product not found")
+    icon = service.get_icon(product_id, request.files)
+    return service.save_icon(product_id, icon)
 
 @app.route('/product/<int:product_id>/image', methods=['GET'])
 def get_image(product_id: int):
-    for product in products:
-        if product.id == product_id:
-            if product.icon and os.path.exists(product.icon):
-                mime_type, _ = mimetypes.guess_type(product.icon)
-                return send_file(product.icon, mimetype=mime_type)
-            abort(404, description="Image not found")
-    abort(404, description="Product not found")
+    icon_path, mime_type, icon_hash = service.get_icon_file(product_id)
+    # conditional=True answers If-None-Match/If-Modified-Since with 304 and serves Range requests
+    return send_file(icon_path, mimetype=mime_type, etag=icon_hash or True, conditional=True)
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,44 @@
+import json
+import uuid
+from json.encoder import encode_basestring_ascii
+
+FIELDS = ("id", "name", "description", "icon", "icon_hash")
+
+
+class Product:
+    # No per-instance __dict__: a product costs a fixed-size object instead of a hash table
+    __slots__ = FIELDS
+
+    def __init__(self, name, description, icon="", icon_hash=""):
+        self.id = uuid.uuid4().int
+        self.name = name
+        self.description = description
+        self.icon = icon
+        self.icon_hash = icon_hash
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        product = cls(data["name"], data["description"], data.get("icon", ""), data.get("icon_hash", ""))
+        product.id = data["id"]
+        return product
+
+
+# Serialize a product straight into a JSON object without building an intermediate dict
+def dump_product(product):
+    try:
+        return (
+            f'{{"id": {product.id:d}, "name": {encode_basestring_ascii(product.name)}, '
+            f'"description": {encode_basestring_ascii(product.description)}, '
+            f'"icon": {encode_basestring_ascii(product.icon)}, '
+            f'"icon_hash": {encode_basestring_ascii(product.icon_hash)}}}'
+        )
+    except TypeError:
+        # Clients may send any JSON value as a name or description, only strings take the fast path
+        return json.dumps(product.to_dict())
+
+
+def dump_products(products):
+    return "[" + ", ".join(map(dump_product, products)) + "]"
@@ -0,0 +1,123 @@
+import bisect
+import re
+import threading
+
+TOKEN = re.compile(r"\w+")
+INDEXED_FIELDS = ("name", "description")
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+# Inverted index over product names and descriptions. Every query term matches
+# indexed tokens it is a prefix of, and a product matches when all terms do.
+# The sorted vocabulary is brought up to date lazily by the next search, so indexing
+# a large catalogue does not pay a list insertion or deletion per new or dropped token
+class SearchIndex:
+    def __init__(self):
+        self._postings = {}  # token -> set of product ids
+        self._vocabulary = []  # sorted tokens, for prefix lookups
+        self._added = set()  # new tokens not in the vocabulary yet
+        self._stale = False  # the vocabulary holds tokens without postings
+        self._tokens = {}  # product id -> its tokens
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._postings)
+
+    # Store listener updating only the tokens that changed
+    def track(self, before, after):
+        old_tokens = self._product_tokens(before)
+        new_tokens = self._product_tokens(after)
+        product_id = (after or before)["id"]
+        with self._lock:
+            for token in old_tokens - new_tokens:
+                self._remove(token, product_id)
+            for token in new_tokens - old_tokens:
+                self._add(token, product_id)
+            if after is None:
+                self._tokens.pop(product_id, None)
+            else:
+                self._tokens[product_id] = new_tokens
+
+    def search(self, query):
+        terms = set(tokenize(query))
+        if not terms:
+            return set()
+
+        with self._lock:
+            self._sync_vocabulary()
+            # Expand only the term with the fewest postings, then narrow its candidates
+            # down: by set intersection for terms matching one token, through the
+            # forward index for wider prefixes
+            ranges = sorted(
+                ((term, self._prefix_range(term)) for term in terms),
+                key=lambda item: self._postings_count(*item[1]),
+            )
+            _, (lo, hi) = ranges[0]
+            result = set()
+            for token in self._vocabulary[lo:hi]:
+                result |= self._postings[token]
+
+            for term, (lo, hi) in ranges[1:]:
+                if not result:
+                    break
+                if hi - lo == 1:
+                    result &= self._postings[self._vocabulary[lo]]
+                else:
+                    tokens = self._tokens
+                    result = {
+                        product_id
+                        for product_id in result
+                        if any(token.startswith(term) for token in tokens[product_id])
+                    }
+        return result
+
+    def _sync_vocabulary(self):
+        if self._stale:
+            postings = self._postings
+            self._vocabulary = [token for token in self._vocabulary if token in postings]
+            self._stale = False
+        if self._added:
+            self._vocabulary += self._added
+            self._vocabulary.sort()
+            self._added.clear()
+
+    def _prefix_range(self, prefix):
+        lo = bisect.bisect_left(self._vocabulary, prefix)
+        hi = bisect.bisect_left(self._vocabulary, prefix + "\U0010ffff", lo)
+        return lo, hi
+
+    def _postings_count(self, lo, hi):
+        return sum(len(self._postings[token]) for token in self._vocabulary[lo:hi])
+
+    def _add(self, token, product_id):
+        ids = self._postings.get(token)
+        if ids is None:
+            ids = self._postings[token] = set()
+            # A token dropped since the last search is still in the vocabulary
+            i = bisect.bisect_left(self._vocabulary, token)
+            if i == len(self._vocabulary) or self._vocabulary[i] != token:
+                self._added.add(token)
+        ids.add(product_id)
+
+    def _remove(self, token, product_id):
+        ids = self._postings[token]
+        ids.discard(product_id)
+        if not ids:
+            del self._postings[token]
+            if token in self._added:
+                self._added.discard(token)
+            else:
+                self._stale = True
+
+    @staticmethod
+    def _product_tokens(product):
+        if product is None:
+            return set()
+        return {
+            token
+            for field in INDEXED_FIELDS
+            for token in tokenize(str(product.get(field, "")))
+        }
@@ -0,0 +1,240 @@
+import atexit
+import heapq
+import json
+import mimetypes
+import os
+
+from werkzeug.exceptions import abort
+
+from blobs import BlobStore
+from cache import ListingCache
+from product import Product, dump_product, dump_products
+from search import SearchIndex
+from storage import LogBackend
+from store import ProductStore
+
+# Shop state and request handling shared by the WSGI (main.py) and ASGI (asgi.py) apps.
+# Handlers take already parsed request data and return (body, status, headers) tuples,
+# which both Flask and Quart turn into responses; errors are raised with werkzeug's abort
+
+ROOT_PATH = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', os.path.join(ROOT_PATH, 'images'))
+# Set STORAGE_FOLDER to an empty string to keep products in memory only
+STORAGE_FOLDER = os.environ.get('STORAGE_FOLDER', os.path.join(ROOT_PATH, 'data'))
+
+MAX_PAGE_SIZE = 1000
+MAX_BATCH_SIZE = 10000
+DEFAULT_SEARCH_LIMIT = 100
+
+def create_backend():
+    if STORAGE_FOLDER:
+        return LogBackend(STORAGE_FOLDER)
+    return None
+
+products = ProductStore(create_backend(), Product.from_dict)
+atexit.register(products.close)
+
+blobs = BlobStore(UPLOAD_FOLDER)
+products.subscribe(blobs.track)
+blobs.collect_garbage()
+
+search_index = SearchIndex()
+products.subscribe(search_index.track)
+
+listing_cache = ListingCache()
+products.subscribe(listing_cache.invalidate)
+
+def json_response(body, status=200, headers=None):
+    return body, status, {'Content-Type': 'application/json', **(headers or {})}
+
+def add_product(data):
+    if not data or 'name' not in data or 'description' not in data:
+        abort(400, description="Missing required fields: name and description")
+    product = Product(data['name'], data['description'])
+    products.add(product)
+    return json_response(dump_product(product), 201)
+
+def get_product(product_id):
+    product = products.get(product_id)
+    if product is None:
+        abort(404, description="Product not found")
+    return json_response(dump_product(product))
+
+def update_product(product_id, data):
+    if not data:
+        abort(400, description="Invalid or missing JSON data")
+    product = products.update(product_id, get_update_fields(data))
+    if product is None:
+        abort(404, description="Product not found")
+    return json_response(dump_product(product))
+
+def invalid_icon(data):
+    return 'icon' in data and not isinstance(data['icon'], str)
+
+def get_update_fields(data):
+    if invalid_icon(data):
+        abort(400, description="icon must be a string")
+    fields = {key: data[key] for key in ('name', 'description', 'icon') if key in data}
+    if 'icon' in fields:
+        # The hash only describes uploaded icons, a path set by hand has to be revalidated by mtime
+        fields['icon_hash'] = ""
+    return fields
+
+def delete_product(product_id):
+    product = products.delete(product_id)
+    if product is None:
+        abort(404, description="Product not found")
+    return json_response(dump_product(product))
+
+def list_products(args, query_string, if_none_match):
+    limit = args.get('limit', type=int)
+    cursor = args.get('cursor', type=int)
+    if 'limit' in args and (limit is None or limit <= 0):
+        abort(400, description="limit must be a positive integer")
+    if 'cursor' in args and cursor is None:
+        abort(400, description="Invalid cursor")
+
+    if args.get('format') == 'ndjson':
+        return stream_products(cursor, limit), 200, {'Content-Type': 'application/x-ndjson'}
+
+    if limit is not None and limit > MAX_PAGE_SIZE:
+        abort(400, description=f"limit must not exceed {MAX_PAGE_SIZE}")
+
+    # Rendered pages are reused until the next mutation, the ETag names the generation
+    generation = listing_cache.generation
+    etag = listing_cache.etag(query_string, generation)
+    headers = {'ETag': f'"{etag}"'}
+    if if_none_match.contains(etag):
+        return '', 304, headers
+
+    cached = listing_cache.get(query_string, generation)
+    if cached is None:
+        items, next_cursor = products.page(cursor, limit)
+        cached = (dump_products(items), next_cursor if limit is not None else None)
+        listing_cache.put(query_string, generation, cached, len(cached[0]))
+    body, next_cursor = cached
+
+    if next_cursor is not None:
+        headers['X-Next-Cursor'] = str(next_cursor)
+    return json_response(body, headers=headers)
+
+# Yield products one JSON document per line, walking the store page by page
+def stream_products(cursor=None, limit=None):
+    remaining = limit
+    while remaining is None or remaining > 0:
+        page_size = MAX_PAGE_SIZE if remaining is None else min(remaining, MAX_PAGE_SIZE)
+        items, cursor = products.page(cursor, page_size)
+        for product in items:
+            yield dump_product(product) + '\n'
+        if remaining is not None:
+            remaining -= len(items)
+        if cursor is None:
+            return
+
+def search_products(args):
+    query = args.get('q', '')
+    limit = args.get('limit', DEFAULT_SEARCH_LIMIT, type=int)
+    if not query.strip():
+        abort(400, description="Missing search query: q")
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        abort(400, description=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    found = heapq.nsmallest(limit, search_index.search(query), key=products.position)
+    return json_response(dump_products(product for product in map(products.get, found) if product is not None))
+
+def check_batch(items):
+    if not isinstance(items, list):
+        abort(400, description="Expected a JSON array")
+    if len(items) > MAX_BATCH_SIZE:
+        abort(400, description=f"Batch must not exceed {MAX_BATCH_SIZE} items")
+    return items
+
+# Per-item batch results are kept as ready JSON strings
+def item_result(status_code, product):
+    return '{"status": %d, "product": %s}' % (status_code, dump_product(product))
+
+def item_error(status_code, message):
+    return json.dumps({'status': status_code, 'error': message})
+
+def dump_results(results):
+    return '[' + ', '.join(results) + ']'
+
+def add_products(items):
+    check_batch(items)
+    results = [None] * len(items)
+    created = []
+    for i, data in enumerate(items):
+        if not isinstance(data, dict) or 'name' not in data or 'description' not in data:
+            results[i] = item_error(400, "Missing required fields: name and description")
+        else:
+            created.append((i, Product(data['name'], data['description'])))
+
+    products.add_many([product for _, product in created])
+    for i, product in created:
+        results[i] = item_result(201, product)
+    return json_response(dump_results(results))
+
+def update_products(items):
+    check_batch(items)
+    results = [None] * len(items)
+    updates = []
+    for i, data in enumerate(items):
+        if not isinstance(data, dict) or not isinstance(data.get('id'), int):
+            results[i] = item_error(400, "Missing required field: id")
+        elif invalid_icon(data):
+            results[i] = item_error(400, "icon must be a string")
+        else:
+            updates.append((i, data['id'], get_update_fields(data)))
+
+    updated = products.update_many([(product_id, fields) for _, product_id, fields in updates])
+    for (i, _, _), product in zip(updates, updated):
+        results[i] = item_result(200, product) if product else item_error(404, "Product not found")
+    return json_response(dump_results(results))
+
+def delete_products(items):
+    check_batch(items)
+    results = [None] * len(items)
+    deletes = []
+    for i, product_id in enumerate(items):
+        if not isinstance(product_id, int):
+            results[i] = item_error(400, "Product id must be an integer")
+        else:
+            deletes.append((i, product_id))
+
+    deleted = products.delete_many([product_id for _, product_id in deletes])
+    for (i, _), product in zip(deletes, deleted):
+        results[i] = item_result(200, product) if product else item_error(404, "Product not found")
+    return json_response(dump_results(results))
+
+# Validate an upload and return the icon file from the multipart form
+def get_icon(product_id, files):
+    if product_id not in products:
+        abort(404, description="Product not found")
+    if 'icon' not in files:
+        abort(400, description="No icon part in the request")
+    icon = files['icon']
+    if icon.filename == '':
+        abort(400, description="No selected file")
+    return icon
+
+# Store the uploaded icon and point the product at it
+def save_icon(product_id, icon):
+    extension = os.path.splitext(icon.filename)[1]
+    icon_path, icon_hash = blobs.save(icon.stream, extension)
+    try:
+        product = products.update(product_id, {'icon': icon_path, 'icon_hash': icon_hash})
+    finally:
+        blobs.release(icon_path)
+    if product is None:
+        abort(404, description="Product not found")
+    return json_response(dump_product(product))
+
+# Return (path, mime type, ETag) of a product's icon
+def get_icon_file(product_id):
+    product = products.get(product_id)
+    if product is None:
+        abort(404, description="Product not found")
+    if not product.icon or not os.path.exists(product.icon):
+        abort(404, description="Image not found")
+    mime_type, _ = mimetypes.guess_type(product.icon)
+    return product.icon, mime_type, product.icon_hash
@@ -0,0 +1,214 @@
+import json
+import os
+import threading
+import time
+
+SNAPSHOT_FILE = "products.snapshot"
+LOG_FILE = "products.log"
+
+
+# Raised to writers once the log could not be written, their changes are not durable
+class StorageError(Exception):
+    pass
+
+
+# Make a rename in `directory` durable, the file's own fsync does not cover its entry
+def fsync_directory(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# Keeps nothing: products live only as long as the process
+class MemoryBackend:
+    def load(self):
+        return []
+
+    def start(self, dump):
+        pass
+
+    def check(self):
+        pass
+
+    def append(self, record):
+        return 0
+
+    def wait(self, ticket):
+        pass
+
+    def close(self):
+        pass
+
+
+# Append-only JSON-lines log with periodic snapshots.
+#
+# Mutations are queued by `append` (called under the store lock, so the log order
+# matches the store order) and written by a single flusher thread, which commits
+# everything queued so far with one write + fsync. `wait` blocks the caller until
+# its record is durable, so concurrent writers share one fsync.
+#
+# Every record carries a sequence number. Once `compact_every` records have been
+# written, the flusher asks the store for a dump, writes it as a snapshot tagged with
+# the last sequence number it covers and starts an empty log. At startup the snapshot
+# is loaded and only the log tail with newer sequence numbers is replayed.
+#
+# If a write, fsync or compaction fails, the backend stops writing: waiting and later
+# writers get a StorageError instead of blocking on a flusher that is gone, and no
+# more records are queued.
+class LogBackend:
+    def __init__(self, directory, compact_every=10000, flush_interval=0.01):
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.log_path = os.path.join(directory, LOG_FILE)
+        self.compact_every = compact_every
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self._dump = None
+        self._pending = []
+        self._last_seq = 0
+        self._committed_seq = 0
+        self._since_snapshot = 0
+        self._closed = False
+        self._error = None
+        self._cond = threading.Condition()
+        self._log = None
+        self._flusher = None
+
+    # Return product dicts in store order, rebuilt from the snapshot and the log tail
+    def load(self):
+        products = {}
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot_seq = json.loads(f.readline())["seq"]
+                for line in f:
+                    product = json.loads(line)
+                    products[product["id"]] = product
+
+        last_seq = snapshot_seq
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "rb+") as f:
+                valid_end = 0
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("incomplete record")
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn write at the end of the log: drop it so new records
+                        # are not appended after garbage
+                        f.truncate(valid_end)
+                        break
+                    valid_end += len(line)
+                    if record["seq"] <= snapshot_seq:
+                        continue
+                    if record["op"] == "put":
+                        products[record["product"]["id"]] = record["product"]
+                    elif record["op"] == "delete":
+                        products.pop(record["id"], None)
+                    last_seq = record["seq"]
+                    self._since_snapshot += 1
+
+        self._last_seq = self._committed_seq = last_seq
+        return list(products.values())
+
+    # `dump` returns (product dicts in store order, last appended sequence number)
+    # and must be taken under the same lock that serializes `append` calls
+    def start(self, dump):
+        self._dump = dump
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    @property
+    def last_seq(self):
+        return self._last_seq
+
+    # Raise StorageError once the log could not be written, before anything is changed
+    def check(self):
+        if self._error:
+            raise StorageError(f"Product log is not writable: {self._error}")
+
+    def append(self, record):
+        with self._cond:
+            self.check()
+            self._last_seq += 1
+            record["seq"] = self._last_seq
+            self._pending.append(json.dumps(record))
+            self._cond.notify()
+            return self._last_seq
+
+    def wait(self, ticket):
+        with self._cond:
+            while self._committed_seq < ticket and not self._closed and not self._error:
+                self._cond.wait()
+            if self._committed_seq < ticket:
+                self.check()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._flusher:
+            self._flusher.join()
+        if self._log:
+            self._log.close()
+
+    def _flush_loop(self):
+        try:
+            self._flush_batches()
+        except Exception as e:
+            with self._cond:
+                self._error = e
+                self._pending = []
+                self._cond.notify_all()
+
+    def _flush_batches(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+            # Let concurrent writers pile up so that they share the fsync below
+            if self.flush_interval:
+                time.sleep(self.flush_interval)
+
+            with self._cond:
+                batch, self._pending = self._pending, []
+                batch_seq = self._last_seq
+
+            self._log.write("\n".join(batch) + "\n")
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._since_snapshot += len(batch)
+
+            with self._cond:
+                self._committed_seq = batch_seq
+                self._cond.notify_all()
+
+            if self._since_snapshot >= self.compact_every:
+                self._compact()
+
+    def _compact(self):
+        products, seq = self._dump()
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"seq": seq}) + "\n")
+            for product in products:
+                f.write(json.dumps(product) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        # The log is emptied below; if the rename were lost in a crash, the old
+        # snapshot would come back without the records the log held
+        fsync_directory(self.directory)
+
+        # Everything up to `seq` is in the snapshot now; records queued after the dump
+        # go to the fresh log, older ones still pending are skipped on load
+        self._log.close()
+        self._log = open(self.log_path, "w", encoding="utf-8")
+        self._since_snapshot = 0
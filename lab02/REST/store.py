@@ -0,0 +1,181 @@
+import bisect
+import logging
+import threading
+
+from storage import MemoryBackend
+
+logger = logging.getLogger(__name__)
+
+
+class ProductStore:
+    # Compact the listing index once more than half of its slots are tombstones
+    COMPACTION_RATIO = 0.5
+    ITER_PAGE_SIZE = 1000
+
+    def __init__(self, backend=None, load_product=None):
+        self._products = {}  # id -> Product
+        self._slots = {}  # id -> position in the listing index
+
+        # Listing index: ids in insertion order, deleted ids are replaced by None.
+        # _seqs holds a monotonically increasing sequence number for every slot,
+        # so it stays sorted and serves as a stable pagination cursor
+        self._order: list[int | None] = []
+        self._seqs: list[int] = []
+        self._next_seq = 0
+        self._tombstones = 0
+
+        self._lock = threading.RLock()
+        self._listeners = []
+
+        self._backend = backend or MemoryBackend()
+        for data in self._backend.load():
+            self._insert(load_product(data))
+        self._backend.start(self._dump)
+
+    def close(self):
+        self._backend.close()
+
+    def __len__(self):
+        return len(self._products)
+
+    def __contains__(self, product_id):
+        return product_id in self._products
+
+    def __iter__(self):
+        cursor = None
+        while True:
+            items, cursor = self.page(cursor, self.ITER_PAGE_SIZE)
+            yield from items
+            if cursor is None:
+                return
+
+    # Return up to `limit` products created after `cursor` and the cursor of the next page
+    def page(self, cursor=None, limit=None):
+        with self._lock:
+            i = 0 if cursor is None else bisect.bisect_right(self._seqs, cursor)
+            items = []
+            while i < len(self._order) and (limit is None or len(items) < limit):
+                product_id = self._order[i]
+                if product_id is not None:
+                    items.append(self._products[product_id])
+                i += 1
+
+            while i < len(self._order) and self._order[i] is None:
+                i += 1
+            next_cursor = self._seqs[i - 1] if i < len(self._order) else None
+        return items, next_cursor
+
+    def get(self, product_id):
+        return self._products.get(product_id)
+
+    # Key ordering products as in the listing, e.g. sorted(ids, key=store.position)
+    def position(self, product_id):
+        return self._slots.get(product_id, -1)
+
+    # Listeners are called as listener(before, after) with product dicts (None for a
+    # created/deleted product) under the store lock, right after every mutation.
+    # Products already in the store are replayed as creations on subscribe
+    def subscribe(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+            for product in self:
+                listener(None, product.to_dict())
+
+    # Mutations are logged under the lock and awaited outside of it,
+    # so that concurrent writers are committed by the backend together
+    def add(self, product):
+        return self.add_many([product])[0]
+
+    def update(self, product_id, fields):
+        return self.update_many([(product_id, fields)])[0]
+
+    def delete(self, product_id):
+        return self.delete_many([product_id])[0]
+
+    # Batch operations apply every item under one lock acquisition and wait for a
+    # single commit. Missing products yield None in the result. Each item is logged
+    # before it is applied, so a backend that can no longer write (StorageError) leaves
+    # the store unchanged
+    def add_many(self, products):
+        ticket = 0
+        with self._lock:
+            self._backend.check()
+            for product in products:
+                if product.id in self._products:
+                    raise KeyError(f"Product {product.id} already exists")
+            for product in products:
+                after = product.to_dict()
+                ticket = self._backend.append({"op": "put", "product": after})
+                self._insert(product)
+                self._notify(None, after)
+        self._backend.wait(ticket)
+        return products
+
+    def update_many(self, updates):
+        results, ticket = [], 0
+        with self._lock:
+            self._backend.check()
+            for product_id, fields in updates:
+                product = self._products.get(product_id)
+                if product is not None:
+                    before = product.to_dict()
+                    previous = {field: getattr(product, field) for field in fields}
+                    for field, value in fields.items():
+                        setattr(product, field, value)
+                    after = product.to_dict()
+                    try:
+                        ticket = self._backend.append({"op": "put", "product": after})
+                    except Exception:
+                        for field, value in previous.items():
+                            setattr(product, field, value)
+                        raise
+                    self._notify(before, after)
+                results.append(product)
+        self._backend.wait(ticket)
+        return results
+
+    def delete_many(self, product_ids):
+        results, ticket = [], 0
+        with self._lock:
+            self._backend.check()
+            for product_id in product_ids:
+                product = self._products.get(product_id)
+                if product is not None:
+                    ticket = self._backend.append({"op": "delete", "id": product_id})
+                    del self._products[product_id]
+                    self._order[self._slots.pop(product_id)] = None
+                    self._tombstones += 1
+                    self._notify(product.to_dict(), None)
+                results.append(product)
+            if self._tombstones > len(self._order) * self.COMPACTION_RATIO:
+                self._compact()
+        self._backend.wait(ticket)
+        return results
+
+    # The change is already applied and logged, so a failing listener must not keep
+    # the others (caches, indexes) from seeing it
+    def _notify(self, before, after):
+        for listener in self._listeners:
+            try:
+                listener(before, after)
+            except Exception:
+                logger.exception(f"Store listener {listener!r} failed")
+
+    def _insert(self, product):
+        self._products[product.id] = product
+        self._slots[product.id] = len(self._order)
+        self._order.append(product.id)
+        self._seqs.append(self._next_seq)
+        self._next_seq += 1
+
+    def _dump(self):
+        with self._lock:
+            dump = [self._products[pid].to_dict() for pid in self._order if pid is not None]
+            return dump, self._backend.last_seq
+
+    def _compact(self):
+        live = [i for i, pid in enumerate(self._order) if pid is not None]
+        self._seqs = [self._seqs[i] for i in live]
+        self._order = [self._order[i] for i in live]
+        self._slots = {pid: i for i, pid in enumerate(self._order)}
+        self._tombstones = 0
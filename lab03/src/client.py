@@ -1,7 +1,11 @@
 import argparse
+import bisect
 import logging
+import os
 import socket
-from const import BUF_SIZE
+import threading
+import time
+from const import BUF_SIZE, BENCH_BUFFER_SIZE
 
 
 def parse_arguments():
@@ -9,6 +13,31 @@ def parse_arguments():
     parser.add_argument("--server_host", help="Server host", default="localhost")
     parser.add_argument("--server_port", type=int, help="Server port", default=12345)
     parser.add_argument("--filename", help="Filename to request", default="index.html")
+    parser.add_argument(
+        "--bench",
+        action="store_true",
+        help="Request the file repeatedly from concurrent connections and report throughput",
+    )
+    parser.add_argument(
+        "--connections", type=int, default=8, help="Concurrent connections (bench mode)"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=10.0, help="Seconds to run (bench mode)"
+    )
+    parser.add_argument(
+        "--requests", type=int, help="Stop after this many requests (bench mode)"
+    )
+    parser.add_argument(
+        "--keep_alive",
+        action="store_true",
+        help="Reuse connections instead of opening one per request (bench mode)",
+    )
+    parser.add_argument(
+        "--sink",
+        choices=["memory", "disk"],
+        default="memory",
+        help="Receive bodies into a reused buffer or write them to files (bench mode)",
+    )
 
     return parser.parse_args()
 
@@ -17,10 +46,14 @@ def send_request(server_host, server_port, filename):
     client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     client_socket.connect((server_host, server_port))
 
-    request = f"GET /{filename} HTTP/1.1\r\nHost: {server_host}:{server_port}\r\n\r\n"
+    request = (
+        f"GET /{filename} HTTP/1.1\r\n"
+        f"Host: {server_host}:{server_port}\r\n"
+        f"Connection: close\r\n\r\n"
+    )
     client_socket.sendall(request.encode())
 
-    response_data = b""
+    response_data = bytearray()
     while True:
         chunk = client_socket.recv(BUF_SIZE)
         if not chunk:
@@ -28,7 +61,7 @@ def send_request(server_host, server_port, filename):
         response_data += chunk
 
     client_socket.close()
-    process_response(response_data, filename)
+    process_response(bytes(response_data), filename)
 
 
 def process_response(response_data, filename):
@@ -59,6 +92,169 @@ def process_response(response_data, filename):
         logging.error(f"Failed to process response: {e}")
 
 
+# One benchmark connection. Responses are received into a buffer allocated once, so the
+# client's cost does not grow with the body size; with a sink file bodies are written out
+class BenchConnection:
+    def __init__(self, server_host, server_port, filename, keep_alive, sink_path=None):
+        self.address = (server_host, server_port)
+        self.keep_alive = keep_alive
+        self.request = (
+            f"GET /{filename} HTTP/1.1\r\n"
+            f"Host: {server_host}:{server_port}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        ).encode()
+        self.buffer = bytearray(BENCH_BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+        self.sink = open(sink_path, "wb") if sink_path else None
+        self.sock = None
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        if self.sink is not None:
+            self.sink.close()
+
+    # Returns (status code, bytes received)
+    def fetch(self):
+        if self.sock is None:
+            self.sock = socket.create_connection(self.address, timeout=30)
+        try:
+            self.sock.sendall(self.request)
+            status, received, reusable = self._read_response()
+        except (OSError, ValueError):
+            self.sock.close()
+            self.sock = None
+            raise
+        if not (self.keep_alive and reusable):
+            self.sock.close()
+            self.sock = None
+        return status, received
+
+    def _read_response(self):
+        filled = 0
+        header_end = -1
+        while header_end == -1:
+            if filled == len(self.buffer):
+                raise ValueError("Response head does not fit into the buffer")
+            count = self.sock.recv_into(self.view[filled:])
+            if count == 0:
+                raise ConnectionError("Connection closed before the response head")
+            header_end = self.buffer.find(b"\r\n\r\n", max(0, filled - 3), filled + count)
+            filled += count
+
+        head = str(self.view[:header_end], "latin-1").split("\r\n")
+        status = int(head[0].split(" ")[1])
+        headers = {}
+        for line in head[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        content_length = headers.get("content-length")
+        reusable = content_length is not None and headers.get("connection", "").lower() != "close"
+
+        body_start = header_end + 4
+        remaining = int(content_length) if content_length is not None else None
+        received = filled
+        self._consume(body_start, filled)
+        if remaining is not None:
+            remaining -= filled - body_start
+        # The rest of the body is received into the same buffer, chunk after chunk
+        while remaining is None or remaining > 0:
+            size = len(self.buffer) if remaining is None else min(remaining, len(self.buffer))
+            count = self.sock.recv_into(self.view[:size])
+            if count == 0:
+                if remaining is None:
+                    break
+                raise ConnectionError("Connection closed in the middle of the body")
+            received += count
+            self._consume(0, count)
+            if remaining is not None:
+                remaining -= count
+        return status, received, reusable
+
+    def _consume(self, start, end):
+        if self.sink is not None and end > start:
+            self.sink.write(self.view[start:end])
+
+
+def run_bench(server_host, server_port, filename, connections, duration, max_requests, keep_alive, sink):
+    results = []  # (status, latency, bytes received), status 0 for failed requests
+    lock = threading.Lock()
+    sent = [0]
+    deadline = time.monotonic() + duration
+
+    def worker(index):
+        sink_path = f"bench_{index}.out" if sink == "disk" else None
+        connection = BenchConnection(server_host, server_port, filename, keep_alive, sink_path)
+        local = []
+        try:
+            while time.monotonic() < deadline:
+                with lock:
+                    if max_requests is not None and sent[0] >= max_requests:
+                        break
+                    sent[0] += 1
+                if connection.sink is not None:
+                    connection.sink.seek(0)
+                    connection.sink.truncate()
+                start = time.perf_counter()
+                try:
+                    status, received = connection.fetch()
+                except (OSError, ValueError) as e:
+                    logging.debug(f"Request failed: {e}")
+                    status, received = 0, 0
+                local.append((status, time.perf_counter() - start, received))
+        finally:
+            connection.close()
+            with lock:
+                results.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(connections)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    if sink == "disk":
+        for i in range(connections):
+            if os.path.exists(f"bench_{i}.out"):
+                os.remove(f"bench_{i}.out")
+    return results, elapsed
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def print_bench_report(results, elapsed):
+    latencies = sorted(latency * 1000 for _, latency, _ in results)
+    errors = sum(1 for status, _, _ in results if status == 0 or status >= 400)
+    received = sum(size for _, _, size in results)
+    print(f"Requests:   {len(results)} in {elapsed:.2f} s, {errors} errors")
+    print(f"Throughput: {len(results) / elapsed:.1f} req/s, {received / elapsed / 1024 / 1024:.2f} MiB/s")
+    if not latencies:
+        return
+    print(
+        f"Latency ms: p50 {percentile(latencies, 50):.3f}, p90 {percentile(latencies, 90):.3f}, "
+        f"p99 {percentile(latencies, 99):.3f}, max {latencies[-1]:.3f}"
+    )
+
+    # Buckets double in width, starting below 0.1 ms
+    bounds = [0.1]
+    while bounds[-1] <= latencies[-1]:
+        bounds.append(bounds[-1] * 2)
+    counts = [0] * len(bounds)
+    for latency in latencies:
+        counts[bisect.bisect_right(bounds, latency)] += 1
+    peak = max(counts)
+    for bound, count in zip(bounds, counts):
+        if count:
+            print(f"  < {bound:9.1f} ms {count:>9} {'#' * max(1, count * 40 // peak)}")
+
+
 if __name__ == "__main__":
     args = parse_arguments()
 
@@ -69,4 +265,17 @@ if __name__ == "__main__":
         datefmt="%Y-%m-%d %H:%M:%S",
     )
 
-    send_request(args.server_host, args.server_port, args.filename)
+    if args.bench:
+        results, elapsed = run_bench(
+            args.server_host,
+            args.server_port,
+            args.filename,
+            args.connections,
+            args.duration,
+            args.requests,
+            args.keep_alive,
+            args.sink,
+        )
+        print_bench_report(results, elapsed)
+    else:
+        send_request(args.server_host, args.server_port, args.filename)
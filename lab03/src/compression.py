@@ -0,0 +1,63 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+}
+
+# Supported codings in order of preference. A precompressed sibling can be sent in any
+# of them, compressing on the fly needs the codec: brotli only with the module installed
+ENCODINGS = ["br", "gzip"]
+ON_THE_FLY_ENCODINGS = (["br"] if brotli is not None else []) + ["gzip"]
+
+# File name suffixes of precompressed siblings, e.g. index.html.gz
+SIBLING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def is_compressible(content_type):
+    return content_type in COMPRESSIBLE_TYPES
+
+
+# Pick the coding for a response from the request's Accept-Encoding header among
+# `available` ones. Returns None if the client accepts none of them
+def choose_encoding(accept_encoding, available=ENCODINGS):
+    if not accept_encoding:
+        return None
+
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.lower()] = weight
+
+    chosen, chosen_weight = None, 0.0
+    for encoding in available:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > chosen_weight:
+            chosen, chosen_weight = encoding, weight
+    return chosen
+
+
+# Compressed on the fly once per file version, so speed is traded for ratio moderately.
+# Siblings made offline can use the maximum levels
+def compress(data: bytes, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6, mtime=0)
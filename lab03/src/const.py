@@ -1,2 +1,33 @@
 DATA_DIR = "data"
 BUF_SIZE = 8192
+
+MAX_HEADER_SIZE = 64 * 1024
+MAX_BODY_SIZE = 1024 * 1024
+KEEP_ALIVE_TIMEOUT = 5
+MAX_KEEP_ALIVE_REQUESTS = 100
+MAX_CONNECTIONS = 10000
+# Files from this size on are sent with sendfile instead of being read into memory
+SENDFILE_MIN_SIZE = 64 * 1024
+# Small files are cached as ready responses, revalidated with stat after this many seconds
+FILE_CACHE_SIZE = 32 * 1024 * 1024
+FILE_CACHE_REVALIDATE = 1.0
+# Range headers with more ranges than this are ignored and the whole file is sent
+MAX_RANGES = 16
+# Text files up to this size are compressed on the fly, larger ones only from .gz/.br siblings
+MAX_COMPRESS_SIZE = 2 * 1024 * 1024
+COMPRESSED_CACHE_SIZE = 16 * 1024 * 1024
+# Seconds a stopping server waits for responses in progress
+GRACEFUL_TIMEOUT = 10
+# Connections waiting for a worker thread, more are answered with 503 and Retry-After
+QUEUE_SIZE = 64
+RETRY_AFTER = 1
+# A worker thread polls an idle keep-alive connection this often and gives it up
+# as soon as another connection is queued
+IDLE_POLL_INTERVAL = 0.1
+MAX_HEADER_COUNT = 100
+# After an error response to a request that was not read completely, the rest is read
+# and dropped for up to this many seconds. Closing with unread data would reset the
+# connection, and the client could lose the response
+LINGER_TIMEOUT = 1.0
+# Receive buffer of each benchmark connection in client.py
+BENCH_BUFFER_SIZE = 256 * 1024
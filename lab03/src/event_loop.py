@@ -0,0 +1,316 @@
+import logging
+import selectors
+import socket
+import time
+from collections import deque
+
+from const import (
+    BUF_SIZE,
+    KEEP_ALIVE_TIMEOUT,
+    MAX_KEEP_ALIVE_REQUESTS,
+    MAX_CONNECTIONS,
+    GRACEFUL_TIMEOUT,
+    LINGER_TIMEOUT,
+)
+from http_parser import ParseError, RequestParser
+from response import MSG_MORE, FileSegment, send_segment
+
+logger = logging.getLogger(__name__)
+
+# Seconds between sweeps for idle keep-alive connections
+SWEEP_INTERVAL = 1.0
+
+
+# Per-connection state: bytes received but not parsed yet and the response being sent.
+# out_view is the rest of the in-memory part being sent, pending the parts after it
+class Connection:
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.in_buffer = bytearray()
+        self.parser = RequestParser()
+        self.out_view = None
+        self.pending = deque()
+        self.response = None
+        self.request_path = None
+        self.request_started = 0.0
+        self.served = 0
+        self.closing = False  # close once the response is sent
+        self.linger = False  # drain unread request bytes before closing
+        self.drain_deadline = None  # set while draining, the response is out
+        self.events = selectors.EVENT_READ
+        self.last_active = time.monotonic()
+
+    @property
+    def name(self):
+        return f"[{self.addr[0]}:{self.addr[1]}]"
+
+
+# Single-threaded server multiplexing all connections over one selector.
+# respond(request, keep_alive) builds the response for a parsed Request,
+# reject(status_code, message) an error response that ends the connection.
+# Once `shutdown` (a threading.Event) is set, the server stops accepting, lets responses
+# in progress finish for up to GRACEFUL_TIMEOUT seconds and returns
+class EventLoopServer:
+    def __init__(
+        self,
+        server_socket: socket.socket,
+        respond,
+        reject,
+        keep_alive_timeout=KEEP_ALIVE_TIMEOUT,
+        max_requests=MAX_KEEP_ALIVE_REQUESTS,
+        max_connections=MAX_CONNECTIONS,
+        shutdown=None,
+        metrics=None,
+        log_connections=True,
+    ):
+        self.server_socket = server_socket
+        self.respond = respond
+        self.reject = reject
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_requests = max_requests
+        self.max_connections = max_connections
+        self.selector = selectors.DefaultSelector()
+        self.connections = {}  # socket -> Connection
+        self.accepting = False
+        self.shutdown = shutdown
+        self.metrics = metrics
+        self.log_connections = log_connections
+        self.stopping = False
+
+    def serve_forever(self):
+        self.server_socket.setblocking(False)
+        self._resume_accepting()
+        next_sweep = time.monotonic() + SWEEP_INTERVAL
+        stop_deadline = None
+        try:
+            while True:
+                for key, events in self.selector.select(SWEEP_INTERVAL):
+                    if key.data is None:
+                        self._accept()
+                        continue
+                    connection = key.data
+                    try:
+                        if events & selectors.EVENT_READ:
+                            self._read(connection)
+                        if events & selectors.EVENT_WRITE and connection.sock in self.connections:
+                            self._write(connection)
+                    except Exception as e:
+                        logger.error(f"{connection.name} Error handling connection: {e}", exc_info=True)
+                        self._close(connection)
+
+                now = time.monotonic()
+                if now >= next_sweep:
+                    self._close_idle(now)
+                    next_sweep = now + SWEEP_INTERVAL
+
+                if self.shutdown is not None and self.shutdown.is_set():
+                    if not self.stopping:
+                        logger.info(f"Shutting down, draining {len(self.connections)} connections")
+                        self.stopping = True
+                        self._pause_accepting()
+                        stop_deadline = now + GRACEFUL_TIMEOUT
+                    self._close_idle(now, 0)
+                    if not self.connections or now >= stop_deadline:
+                        return
+        finally:
+            for connection in list(self.connections.values()):
+                self._close(connection)
+            self.selector.close()
+
+    def _resume_accepting(self):
+        if not self.accepting:
+            self.selector.register(self.server_socket, selectors.EVENT_READ)
+            self.accepting = True
+
+    # At max_connections new clients wait in the listen backlog instead of being accepted
+    def _pause_accepting(self):
+        if self.accepting:
+            self.selector.unregister(self.server_socket)
+            self.accepting = False
+
+    def _accept(self):
+        while len(self.connections) < self.max_connections:
+            try:
+                sock, addr = self.server_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.error(f"Error accepting connection: {e}")
+                return
+            sock.setblocking(False)
+            connection = Connection(sock, addr)
+            self.connections[sock] = connection
+            self.selector.register(sock, selectors.EVENT_READ, connection)
+            if self.metrics is not None:
+                self.metrics.connection_opened()
+            if self.log_connections:
+                logger.info(f"{connection.name} Connection established")
+        self._pause_accepting()
+
+    def _read(self, connection):
+        try:
+            chunk = connection.sock.recv(BUF_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except ConnectionError:
+            self._close(connection)
+            return
+        if connection.drain_deadline is not None:
+            if not chunk:
+                self._close(connection)
+            return
+        if not chunk:
+            if connection.in_buffer:
+                logger.debug(f"{connection.name} Connection closed in the middle of a request")
+            self._close(connection)
+            return
+        connection.last_active = time.monotonic()
+        connection.in_buffer += chunk
+        self._process(connection)
+
+    # Answer buffered requests in order. The next one is only parsed once the previous
+    # response is out, so a client pipelining requests cannot make the server queue an
+    # unbounded amount of responses
+    def _process(self, connection):
+        while not connection.closing and connection.response is None:
+            try:
+                request, consumed = connection.parser.parse(connection.in_buffer)
+            except ParseError as e:
+                logger.warning(f"{connection.name} Rejecting request: {e.status_code} {e.message}")
+                self._start_response(connection, self.reject(e.status_code, e.message), None)
+                connection.closing = True
+                connection.linger = True
+                self._flush(connection)
+                return
+            if request is None:
+                return
+
+            del connection.in_buffer[:consumed]
+            connection.served += 1
+            keep_alive = (
+                request.keep_alive
+                and connection.served < self.max_requests
+                and not self.stopping
+            )
+            started = time.perf_counter()
+            self._start_response(connection, self.respond(request, keep_alive), request.path, started)
+            connection.closing = not keep_alive
+            self._flush(connection)
+
+    def _start_response(self, connection, response, path, started=None):
+        connection.response = response
+        connection.request_path = path
+        connection.request_started = time.perf_counter() if started is None else started
+        connection.pending.extend(response.parts)
+
+    def _write(self, connection):
+        self._flush(connection)
+        if connection.sock in self.connections and connection.response is None:
+            self._process(connection)
+
+    # Send as much of the response as the socket takes and wait for it to drain
+    # before reading again
+    def _flush(self, connection):
+        try:
+            while self._send_part(connection):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        except ConnectionError:
+            self._close(connection)
+            return
+        connection.last_active = time.monotonic()
+
+        if connection.out_view is not None or connection.pending:
+            self._watch(connection, selectors.EVENT_WRITE)
+            return
+
+        connection.response.close()
+        if self.metrics is not None:
+            self.metrics.observe(
+                connection.request_path,
+                connection.response.status_code,
+                time.perf_counter() - connection.request_started,
+                connection.response.length,
+            )
+        connection.response = None
+        if connection.closing and connection.linger:
+            self._drain(connection)
+        elif connection.closing:
+            self._close(connection)
+        else:
+            self._watch(connection, selectors.EVENT_READ)
+
+    # Stop sending and read what is left of a rejected request until the client closes
+    # or LINGER_TIMEOUT passes, closing with unread data would reset the connection
+    # before the client has read the error response
+    def _drain(self, connection):
+        try:
+            connection.sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            self._close(connection)
+            return
+        connection.in_buffer = bytearray()
+        connection.drain_deadline = time.monotonic() + LINGER_TIMEOUT
+        self._watch(connection, selectors.EVENT_READ)
+
+    # Send some of the current part, returns True while the socket may take more
+    def _send_part(self, connection):
+        if connection.out_view is None:
+            if not connection.pending:
+                return False
+            part = connection.pending[0]
+            if isinstance(part, FileSegment):
+                if not send_segment(connection.sock, part):
+                    connection.pending.popleft()
+                return True
+            connection.out_view = memoryview(connection.pending.popleft())
+
+        flags = MSG_MORE if connection.pending else 0
+        sent = connection.sock.send(connection.out_view, flags)
+        connection.out_view = connection.out_view[sent:]
+        if connection.out_view:
+            return False
+        connection.out_view = None
+        return True
+
+    def _watch(self, connection, events):
+        if connection.events != events:
+            self.selector.modify(connection.sock, events, connection)
+            connection.events = events
+
+    # Close connections idle for `timeout` seconds between requests, and like the threads
+    # engine's send timeout, responses the client has not taken any of for keep_alive_timeout
+    def _close_idle(self, now, timeout=None):
+        timeout = self.keep_alive_timeout if timeout is None else timeout
+        for connection in list(self.connections.values()):
+            if connection.drain_deadline is not None:
+                if now >= connection.drain_deadline or self.stopping:
+                    self._close(connection)
+            elif connection.response is None:
+                if now - connection.last_active >= timeout:
+                    logger.debug(f"{connection.name} Connection idle for {timeout} s, closing")
+                    self._close(connection)
+            elif now - connection.last_active >= self.keep_alive_timeout:
+                logger.debug(
+                    f"{connection.name} Client has not read for {self.keep_alive_timeout} s, closing"
+                )
+                self._close(connection)
+
+    def _close(self, connection):
+        if self.connections.pop(connection.sock, None) is None:
+            return
+        self.selector.unregister(connection.sock)
+        if connection.response is not None:
+            connection.response.close()
+        try:
+            connection.sock.close()
+        except OSError:
+            pass
+        if self.metrics is not None:
+            self.metrics.connection_closed()
+        if self.log_connections:
+            logger.info(f"{connection.name} Connection closed")
+        if not self.stopping:
+            self._resume_accepting()
@@ -0,0 +1,72 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from const import FILE_CACHE_SIZE, FILE_CACHE_REVALIDATE
+
+
+# LRU cache of prebuilt responses for small files, bounded by their total size.
+# An entry is trusted for `revalidate` seconds, then the file is stat'ed again and
+# the entry dropped if its mtime or size changed
+class FileCache:
+    def __init__(self, max_size=FILE_CACHE_SIZE, revalidate=FILE_CACHE_REVALIDATE):
+        self.max_size = max_size
+        self.revalidate = revalidate
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, path, (mtime, size), checked_at)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[3] >= self.revalidate:
+                entry = self._revalidate(key, entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    # `stat` is the one taken when the file was opened to build `value`
+    def put(self, key, path, stat, value):
+        size = len(value)
+        with self._lock:
+            if size > self.max_size:
+                return
+            self._remove(key)
+            self._entries[key] = (value, path, (stat.st_mtime_ns, stat.st_size), time.monotonic())
+            self._size += size
+            while self._size > self.max_size:
+                _, (evicted, _, _, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "size": self._size,
+            }
+
+    def _revalidate(self, key, entry):
+        value, path, version, _ = entry
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+        if stat is None or (stat.st_mtime_ns, stat.st_size) != version:
+            self._remove(key)
+            return None
+        entry = (value, path, version, time.monotonic())
+        self._entries[key] = entry
+        return entry
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[0])
@@ -0,0 +1,34 @@
+from const import MAX_RANGES
+
+
+# Parse a "bytes=" Range header into (start, end) pairs with inclusive ends.
+# Returns None if the header has to be ignored (malformed, other unit, too many ranges)
+# and an empty list if none of the ranges overlaps the file
+def parse_range(value: str, size: int):
+    unit, _, specs = value.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    specs = specs.split(",")
+    if len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        first, dash, last = spec.strip().partition("-")
+        if not dash:
+            return None
+        if not first:
+            # Suffix range: the last `last` bytes
+            if not last.isdigit():
+                return None
+            if int(last) > 0 and size > 0:
+                ranges.append((max(0, size - int(last)), size - 1))
+            continue
+        if not first.isdigit() or (last and not last.isdigit()):
+            return None
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start < size:
+            ranges.append((start, min(int(last), size - 1) if last else size - 1))
+    return ranges
@@ -0,0 +1,122 @@
+from const import MAX_BODY_SIZE, MAX_HEADER_SIZE, MAX_HEADER_COUNT
+
+
+# Raised for requests that cannot be answered normally, the connection is closed after
+# an error response with this status
+class ParseError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+class Request:
+    def __init__(self, method, target, version, headers, head_size, body_length):
+        self.method = method
+        self.target = target
+        self.version = version
+        self.headers = headers  # lowercase name -> value, repeated headers joined with ", "
+        self.head_size = head_size  # the body is buffer[head_size:head_size + body_length]
+        self.body_length = body_length
+
+    # Target without the query string
+    @property
+    def path(self):
+        return self.target.partition("?")[0]
+
+    def header(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    # HTTP/1.1 connections are persistent unless the client asks to close them,
+    # HTTP/1.0 ones only when the client asks to keep them open
+    @property
+    def keep_alive(self):
+        connection = self.header("Connection", "").lower()
+        if "transfer-encoding" in self.headers:
+            return False  # chunked request bodies are not parsed, so the stream cannot be resynced
+        if self.version == "HTTP/1.1":
+            return connection != "close"
+        return connection == "keep-alive"
+
+
+# Incremental parser over a connection's receive buffer. The caller appends received
+# bytes to the buffer and calls parse() until it returns a request, then removes the
+# consumed bytes. The head is searched only once per received byte and decoded field by
+# field straight from the buffer, the body is never copied or decoded
+class RequestParser:
+    def __init__(
+        self,
+        max_header_size=MAX_HEADER_SIZE,
+        max_body_size=MAX_BODY_SIZE,
+        max_header_count=MAX_HEADER_COUNT,
+    ):
+        self.max_header_size = max_header_size
+        self.max_body_size = max_body_size
+        self.max_header_count = max_header_count
+        self._scanned = 0  # bytes already searched for the end of the head
+        self._request = None  # parsed head still waiting for its body
+
+    # Returns (request, bytes consumed) once the head and body are complete,
+    # (None, 0) if more data is needed
+    def parse(self, buffer: bytearray):
+        if self._request is None:
+            # The terminator may straddle the bytes searched before
+            end = buffer.find(b"\r\n\r\n", max(0, self._scanned - 3), self.max_header_size)
+            if end == -1:
+                self._scanned = len(buffer)
+                if len(buffer) >= self.max_header_size:
+                    raise ParseError(431, "Request Header Fields Too Large")
+                return None, 0
+            with memoryview(buffer) as view:
+                self._request = self._parse_head(buffer, view, end)
+
+        consumed = self._request.head_size + self._request.body_length
+        if len(buffer) < consumed:
+            return None, 0
+        request = self._request
+        self._request = None
+        self._scanned = 0
+        return request, consumed
+
+    def _parse_head(self, buffer, view, end):
+        line_end = buffer.find(b"\r\n", 0, end + 2)
+        request_line = str(view[:line_end], "latin-1").split(" ")
+        if len(request_line) != 3 or not request_line[2].startswith("HTTP/"):
+            raise ParseError(400, "Bad Request")
+        method, target, version = request_line
+
+        headers = {}
+        count = 0
+        position = line_end + 2
+        while position < end + 2:
+            line_end = buffer.find(b"\r\n", position, end + 2)
+            colon = buffer.find(b":", position, line_end)
+            if colon == -1:
+                raise ParseError(400, "Bad Request")
+            name = str(view[position:colon], "latin-1").lower()
+            # Also rejects folded lines and whitespace before the colon, as RFC 9112 asks
+            if not name or " " in name or "\t" in name:
+                raise ParseError(400, "Bad Request")
+            count += 1
+            if count > self.max_header_count:
+                raise ParseError(431, "Request Header Fields Too Large")
+            value = str(view[colon + 1 : line_end], "latin-1").strip(" \t")
+            headers[name] = f"{headers[name]}, {value}" if name in headers else value
+            position = line_end + 2
+
+        return Request(method, target, version, headers, end + 4, self._body_length(headers))
+
+    def _body_length(self, headers):
+        if "transfer-encoding" in headers:
+            return 0
+        content_length = headers.get("content-length")
+        if content_length is None:
+            return 0
+        # Repeated headers are joined, differing values make the framing ambiguous
+        values = {value.strip() for value in content_length.split(",")}
+        if len(values) != 1 or not next(iter(values)).isdigit():
+            raise ParseError(400, "Bad Request")
+        body_length = int(values.pop())
+        if body_length > self.max_body_size:
+            raise ParseError(413, "Content Too Large")
+        return body_length
@@ -0,0 +1,115 @@
+import bisect
+import threading
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Paths beyond this many are counted under OTHER_PATH, so scans for random URLs
+# cannot grow the metrics without bound
+MAX_PATHS = 256
+OTHER_PATH = "other"
+# Type and help of the values in cache and pool stats(). Counters get a _total suffix,
+# names not listed here are exported as gauges without help
+STATS_METRICS = {
+    "hits": ("counter", "Lookups answered from the cache."),
+    "misses": ("counter", "Lookups not answered from the cache."),
+    "entries": ("gauge", "Entries in the cache."),
+    "size": ("gauge", "Bytes held by the cache."),
+    "workers": ("gauge", "Worker threads."),
+    "busy_workers": ("gauge", "Workers handling a connection."),
+    "queue_depth": ("gauge", "Connections waiting for a worker."),
+    "max_queue_depth": ("gauge", "Most connections that have waited for a worker at once."),
+    "submitted": ("counter", "Connections queued for a worker."),
+    "rejected": ("counter", "Connections refused because the queue was full."),
+    "avg_wait_ms": ("gauge", "Average time a connection waited for a worker, in milliseconds."),
+    "max_wait_ms": ("gauge", "Longest time a connection waited for a worker, in milliseconds."),
+}
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Request counters and latency histograms per path and status code, open connections
+# and bytes sent, rendered in the Prometheus text format
+class Metrics:
+    def __init__(self):
+        self.requests = {}  # (path, status code) -> count
+        self.latencies = {}  # path -> [bucket counts..., +Inf count]
+        self.latency_sums = {}  # path -> seconds
+        self.connections = 0
+        self.connections_total = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def connection_opened(self):
+        with self._lock:
+            self.connections += 1
+            self.connections_total += 1
+
+    def connection_closed(self):
+        with self._lock:
+            self.connections -= 1
+
+    # `path` is None for requests that could not be parsed
+    def observe(self, path, status_code, latency, bytes_sent):
+        with self._lock:
+            if path is None or (path not in self.latencies and len(self.latencies) >= MAX_PATHS):
+                path = OTHER_PATH
+            key = (path, status_code)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            buckets = self.latencies.get(path)
+            if buckets is None:
+                buckets = self.latencies[path] = [0] * (len(LATENCY_BUCKETS) + 1)
+                self.latency_sums[path] = 0.0
+            buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+            self.latency_sums[path] += latency
+            self.bytes_sent += bytes_sent
+
+    # `stats` maps a metric name prefix to a stats() dict of a cache or pool, see STATS_METRICS
+    def render(self, stats=None):
+        with self._lock:
+            lines = [
+                "# HELP lab03_requests_total Requests answered, by path and status code.",
+                "# TYPE lab03_requests_total counter",
+            ]
+            for (path, status_code), count in sorted(self.requests.items()):
+                lines.append(
+                    f'lab03_requests_total{{path="{escape_label(path)}",status="{status_code}"}} {count}'
+                )
+
+            lines += [
+                "# HELP lab03_request_duration_seconds Time from a parsed request to its sent response.",
+                "# TYPE lab03_request_duration_seconds histogram",
+            ]
+            for path, buckets in sorted(self.latencies.items()):
+                label = escape_label(path)
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), buckets):
+                    cumulative += count
+                    lines.append(
+                        f'lab03_request_duration_seconds_bucket{{path="{label}",le="{bound}"}} {cumulative}'
+                    )
+                lines.append(f'lab03_request_duration_seconds_sum{{path="{label}"}} {self.latency_sums[path]}')
+                lines.append(f'lab03_request_duration_seconds_count{{path="{label}"}} {cumulative}')
+
+            lines += [
+                "# HELP lab03_connections_in_flight Open client connections.",
+                "# TYPE lab03_connections_in_flight gauge",
+                f"lab03_connections_in_flight {self.connections}",
+                "# HELP lab03_connections_total Accepted client connections.",
+                "# TYPE lab03_connections_total counter",
+                f"lab03_connections_total {self.connections_total}",
+                "# HELP lab03_response_bytes_total Bytes of responses sent.",
+                "# TYPE lab03_response_bytes_total counter",
+                f"lab03_response_bytes_total {self.bytes_sent}",
+            ]
+
+        for prefix, values in (stats or {}).items():
+            for name, value in values.items():
+                kind, help_text = STATS_METRICS.get(name, ("gauge", None))
+                metric = f"{prefix}_{name}_total" if kind == "counter" else f"{prefix}_{name}"
+                if help_text is not None:
+                    lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} {kind}")
+                lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
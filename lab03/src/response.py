@@ -0,0 +1,55 @@
+import os
+import socket
+
+# Tells the kernel more data follows, so a header is not sent in a packet of its own
+MSG_MORE = getattr(socket, "MSG_MORE", 0)
+
+
+# count bytes of an open file starting at offset, sent straight from the page cache
+class FileSegment:
+    def __init__(self, file, offset, count):
+        self.file = file
+        self.offset = offset
+        self.count = count
+
+
+# A response is a list of parts: bytes built in userspace (the header, small bodies)
+# and FileSegments that are never read into memory
+class Response:
+    def __init__(self, status_code, parts):
+        self.status_code = status_code
+        self.parts = parts
+        self.length = sum(part.count if isinstance(part, FileSegment) else len(part) for part in parts)
+
+    # Send over a blocking socket
+    def send(self, sock: socket.socket):
+        try:
+            for i, part in enumerate(self.parts):
+                if isinstance(part, FileSegment):
+                    sent = sock.sendfile(part.file, part.offset, part.count)
+                    if sent < part.count:
+                        raise ConnectionError("File shrank while it was being sent")
+                else:
+                    sock.sendall(part, MSG_MORE if i + 1 < len(self.parts) else 0)
+        finally:
+            self.close()
+
+    def close(self):
+        for part in self.parts:
+            if isinstance(part, FileSegment):
+                part.file.close()
+
+
+# Send a segment over a non-blocking socket, advancing it by the bytes sent.
+# Returns False once nothing is left, raises BlockingIOError if the socket is full
+def send_segment(sock: socket.socket, segment: FileSegment):
+    if hasattr(os, "sendfile"):
+        sent = os.sendfile(sock.fileno(), segment.file.fileno(), segment.offset, segment.count)
+    else:
+        segment.file.seek(segment.offset)
+        sent = sock.send(segment.file.read(min(segment.count, 1024 * 1024)))
+    if sent == 0:
+        raise ConnectionError("File shrank while it was being sent")
+    segment.offset += sent
+    segment.count -= sent
+    return segment.count > 0
@@ -2,9 +2,59 @@ import socket
 import threading
 import argparse
 import logging
+import os
+import secrets
+import signal
+import time
+from email.utils import formatdate
 from pathlib import Path
 
-from const import DATA_DIR, BUF_SIZE
+from const import (
+    DATA_DIR,
+    BUF_SIZE,
+    KEEP_ALIVE_TIMEOUT,
+    MAX_KEEP_ALIVE_REQUESTS,
+    MAX_CONNECTIONS,
+    SENDFILE_MIN_SIZE,
+    FILE_CACHE_SIZE,
+    FILE_CACHE_REVALIDATE,
+    MAX_COMPRESS_SIZE,
+    COMPRESSED_CACHE_SIZE,
+    GRACEFUL_TIMEOUT,
+    IDLE_POLL_INTERVAL,
+    LINGER_TIMEOUT,
+    QUEUE_SIZE,
+    RETRY_AFTER,
+)
+from compression import (
+    ENCODINGS,
+    ON_THE_FLY_ENCODINGS,
+    SIBLING_SUFFIXES,
+    choose_encoding,
+    compress,
+    is_compressible,
+)
+from event_loop import EventLoopServer
+from file_cache import FileCache
+from helpers import parse_range
+from http_parser import ParseError, Request, RequestParser
+from metrics import Metrics
+from response import FileSegment, Response
+from supervisor import Supervisor
+from worker_pool import WorkerPool
+
+logger = logging.getLogger(__name__)
+file_cache = FileCache()
+# Keyed by file version, so entries never need revalidating
+compressed_cache = FileCache(COMPRESSED_CACHE_SIZE, revalidate=float("inf"))
+# Set on SIGTERM: stop accepting, finish responses in progress and exit
+shutdown_event = threading.Event()
+metrics = Metrics()
+worker_pool = None
+# Per-connection log lines cost more than serving a cached file, --no_connection_log drops them
+log_connections = True
+
+METRICS_PATH = "/__metrics"
 
 
 def parse_arguments():
@@ -16,7 +66,69 @@ def parse_arguments():
         "--concurrency_level",
         type=int,
         default=1,
-        help="Maximum number of concurrent connections",
+        help="Maximum number of concurrent connections (threads engine)",
+    )
+    parser.add_argument(
+        "--queue_size",
+        type=int,
+        default=QUEUE_SIZE,
+        help="Connections waiting for a free thread before new ones get 503 (threads engine)",
+    )
+    parser.add_argument(
+        "--engine",
+        type=str,
+        default="threads",
+        choices=["threads", "selectors"],
+        help="Serve each connection in its own thread or all of them from one event loop",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Serve from this many processes sharing the port with SO_REUSEPORT, "
+        "supervised by the main one (SIGHUP restarts them gracefully)",
+    )
+    parser.add_argument(
+        "--max_connections",
+        type=int,
+        default=MAX_CONNECTIONS,
+        help="Maximum number of open connections (selectors engine)",
+    )
+    parser.add_argument(
+        "--keep_alive_timeout",
+        type=float,
+        default=KEEP_ALIVE_TIMEOUT,
+        help="Seconds an idle persistent connection is kept open",
+    )
+    parser.add_argument(
+        "--max_keep_alive_requests",
+        type=int,
+        default=MAX_KEEP_ALIVE_REQUESTS,
+        help="Maximum number of requests served over one connection",
+    )
+    parser.add_argument(
+        "--file_cache_size",
+        type=int,
+        default=FILE_CACHE_SIZE,
+        help="Bytes of small file responses kept in memory, 0 disables the cache",
+    )
+    parser.add_argument(
+        "--file_cache_revalidate",
+        type=float,
+        default=FILE_CACHE_REVALIDATE,
+        help="Seconds a cached file is served before checking it for changes",
+    )
+    parser.add_argument(
+        "--compressed_cache_size",
+        type=int,
+        default=COMPRESSED_CACHE_SIZE,
+        help="Bytes of files compressed on the fly kept in memory",
+    )
+    parser.add_argument(
+        "--no_connection_log",
+        dest="connection_log",
+        action="store_false",
+        help="Do not log every connection, use the /__metrics endpoint to watch the load",
     )
     parser.add_argument(
         "--log_level",
@@ -25,7 +137,12 @@ def parse_arguments():
         choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
         help="Set the logging level",
     )
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.queue_size < 1:
+        parser.error("--queue_size must be at least 1")
+    if args.workers and not (hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT")):
+        parser.error("--workers needs fork and SO_REUSEPORT, which this platform lacks")
+    return args
 
 
 def get_content_type(file_extension):
@@ -47,121 +164,481 @@ def get_content_type(file_extension):
     return content_types.get(file_extension, "application/octet-stream")
 
 
-def get_response(request: str):
-    try:
-        request_parts = request.split()
-        if len(request_parts) < 2:
-            logger.warning("Malformed request received")
-            return build_error_response(400, "Bad Request")
+def get_connection_header(keep_alive):
+    return "Connection: keep-alive" if keep_alive else "Connection: close"
 
-        method, path = request_parts[0], request_parts[1]
+
+def get_response(request: Request, keep_alive=False):
+    try:
+        method, path = request.method, request.path
 
         if method != "GET":
-            return build_error_response(501, "Not Implemented")
+            return build_error_response(501, "Not Implemented", keep_alive)
+
+        if path == METRICS_PATH:
+            return get_metrics_response(keep_alive)
 
         filename = path[1:] if path.startswith("/") else path
         filepath = Path.cwd() / DATA_DIR / filename
-        if Path.exists(filepath) and Path.is_file(filepath):
-            with open(filepath, "rb") as file:
-                content = file.read()
-            header = (
-                f"HTTP/1.1 200 OK\r\n"
-                f"Content-Type: {get_content_type(filepath.suffix)}\r\n"
-                f"Content-Length: {len(content)}\r\n"
-                f"Connection: close\r\n\r\n"
+        range_header = request.header("Range")
+        # Ranges are served from the uncompressed file, only full responses are compressed
+        encoding = None
+        if range_header is None and is_compressible(get_content_type(filepath.suffix)):
+            encoding = choose_encoding(
+                request.header("Accept-Encoding"), available_encodings(filepath)
             )
-            response = header.encode() + content
-            logger.debug(f"File found: {filepath}, size: {len(content)} bytes")
-            return response
+
+        # Partial responses are built from the file every time, only full ones are cached
+        cache_key = (filepath, keep_alive, encoding)
+        if range_header is None:
+            cached = file_cache.get(cache_key)
+            if cached is not None:
+                return Response(200, [cached])
+
+        if Path.exists(filepath) and Path.is_file(filepath):
+            file = open(filepath, "rb")
+            try:
+                return get_file_response(
+                    request, filepath, file, keep_alive, cache_key, encoding
+                )
+            except BaseException:
+                file.close()
+                raise
         else:
             logger.debug(f"File not found: {filepath}")
-            return build_error_response(404, "Not Found")
+            return build_error_response(404, "Not Found", keep_alive)
     except Exception as e:
         logger.error(f"Error processing request: {e}", exc_info=True)
-        return build_error_response(500, "Internal Server Error")
+        return build_error_response(500, "Internal Server Error", keep_alive)
+
+
+# Build a 200, 206 or 416 response for an open file. Streamed responses keep the
+# file open until they are sent, otherwise it is closed here
+def get_file_response(request, filepath, file, keep_alive, cache_key, encoding=None):
+    stat = os.fstat(file.fileno())
+    size = stat.st_size
+    content_type = get_content_type(filepath.suffix)
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+    # Caches have to keep compressed and plain variants of text files apart
+    vary = "Vary: Accept-Encoding\r\n" if is_compressible(content_type) else ""
+    validators = (
+        f"ETag: {etag}\r\n"
+        f"Last-Modified: {last_modified}\r\n"
+        f"Accept-Ranges: bytes\r\n"
+        f"{vary}"
+    )
+    connection = get_connection_header(keep_alive)
+    logger.debug(f"File found: {filepath}, size: {size} bytes")
+
+    ranges = None
+    range_header = request.header("Range")
+    if_range = request.header("If-Range")
+    # A Range is only honoured if the client's copy (named by If-Range) is still current
+    if range_header is not None and if_range in (None, etag, last_modified):
+        ranges = parse_range(range_header, size)
+
+    if ranges is None and encoding is not None:
+        response = get_encoded_response(
+            filepath, file, stat, encoding, content_type, last_modified, connection, cache_key
+        )
+        if response is not None:
+            return response
+
+    if ranges is None:
+        header = (
+            f"HTTP/1.1 200 OK\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {size}\r\n"
+            f"{validators}"
+            f"{connection}\r\n\r\n"
+        ).encode()
+        # Small files go out with the header in one send, larger ones are streamed from disk
+        if size < SENDFILE_MIN_SIZE:
+            with file:
+                response = header + file.read(size)
+            file_cache.put(cache_key, filepath, stat, response)
+            return Response(200, [response])
+        return Response(200, [header, FileSegment(file, 0, size)])
+
+    if not ranges:
+        file.close()
+        return build_error_response(
+            416, "Range Not Satisfiable", keep_alive, f"Content-Range: bytes */{size}\r\n"
+        )
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        header = (
+            f"HTTP/1.1 206 Partial Content\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n"
+            f"Content-Length: {end - start + 1}\r\n"
+            f"{validators}"
+            f"{connection}\r\n\r\n"
+        ).encode()
+        return Response(206, [header, FileSegment(file, start, end - start + 1)])
+
+    # Several ranges are sent as multipart/byteranges, each part streamed from the file
+    boundary = secrets.token_hex(12)
+    body = []
+    for start, end in ranges:
+        body.append(
+            (
+                f"\r\n--{boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+            ).encode()
+        )
+        body.append(FileSegment(file, start, end - start + 1))
+    body.append(f"\r\n--{boundary}--\r\n".encode())
+    content_length = sum(part.count if isinstance(part, FileSegment) else len(part) for part in body)
+    header = (
+        f"HTTP/1.1 206 Partial Content\r\n"
+        f"Content-Type: multipart/byteranges; boundary={boundary}\r\n"
+        f"Content-Length: {content_length}\r\n"
+        f"{validators}"
+        f"{connection}\r\n\r\n"
+    ).encode()
+    return Response(206, [header] + body)
+
+
+# Full response compressed with `encoding`, read from an up-to-date precompressed sibling
+# (index.html.gz) or compressed here once per file version. Returns None if the file is
+# too large to compress on the fly, it is then sent uncompressed
+def get_encoded_response(
+    filepath, file, stat, encoding, content_type, last_modified, connection, cache_key
+):
+    sibling = open_precompressed(sibling_path(filepath, encoding), stat)
+    if sibling is not None:
+        file.close()
+        body_size = os.fstat(sibling.fileno()).st_size
+    elif stat.st_size > MAX_COMPRESS_SIZE or encoding not in ON_THE_FLY_ENCODINGS:
+        return None
+    else:
+        compressed_key = (filepath, encoding, stat.st_mtime_ns, stat.st_size)
+        body = compressed_cache.get(compressed_key)
+        if body is None:
+            with file:
+                body = compress(file.read(stat.st_size), encoding)
+            compressed_cache.put(compressed_key, filepath, stat, body)
+        else:
+            file.close()
+        body_size = len(body)
+
+    header = (
+        f"HTTP/1.1 200 OK\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Encoding: {encoding}\r\n"
+        f"Content-Length: {body_size}\r\n"
+        f'ETag: "{stat.st_mtime_ns:x}-{stat.st_size:x}-{encoding}"\r\n'
+        f"Last-Modified: {last_modified}\r\n"
+        f"Vary: Accept-Encoding\r\n"
+        f"{connection}\r\n\r\n"
+    ).encode()
+    logger.debug(f"Sending {filepath} with {encoding}, {stat.st_size} -> {body_size} bytes")
+    if sibling is not None and body_size >= SENDFILE_MIN_SIZE:
+        return Response(200, [header, FileSegment(sibling, 0, body_size)])
+    if sibling is not None:
+        with sibling:
+            body = sibling.read(body_size)
+
+    # Validated against the original file, which changes whenever its siblings are rebuilt
+    response = header + body
+    if body_size < SENDFILE_MIN_SIZE:
+        file_cache.put(cache_key, filepath, stat, response)
+    return Response(200, [response])
 
 
-def build_error_response(status_code, message):
+def sibling_path(filepath, encoding):
+    return filepath.with_name(filepath.name + SIBLING_SUFFIXES[encoding])
+
+
+# Codings the file can be sent in: those compressed here and those with a precompressed
+# sibling, only the latter have to be looked up on disk
+def available_encodings(filepath):
+    return [
+        encoding
+        for encoding in ENCODINGS
+        if encoding in ON_THE_FLY_ENCODINGS or sibling_path(filepath, encoding).exists()
+    ]
+
+
+# A sibling older than the file it was made from is ignored
+def open_precompressed(path, stat):
+    try:
+        file = open(path, "rb")
+    except OSError:
+        return None
+    if os.fstat(file.fileno()).st_mtime_ns < stat.st_mtime_ns:
+        file.close()
+        return None
+    return file
+
+
+def get_metrics_response(keep_alive):
+    stats = {
+        "lab03_file_cache": file_cache.stats(),
+        "lab03_compressed_cache": compressed_cache.stats(),
+    }
+    if worker_pool is not None:
+        stats["lab03_worker_pool"] = worker_pool.stats()
+    content = metrics.render(stats).encode()
+    header = (
+        f"HTTP/1.1 200 OK\r\n"
+        f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+        f"Content-Length: {len(content)}\r\n"
+        f"Cache-Control: no-store\r\n"
+        f"{get_connection_header(keep_alive)}\r\n\r\n"
+    )
+    return Response(200, [header.encode() + content])
+
+
+def build_error_response(status_code, message, keep_alive=False, extra_headers=""):
     content = f"<html><body><h1>{status_code} {message}</h1></body></html>".encode()
     header = (
         f"HTTP/1.1 {status_code} {message}\r\n"
         f"Content-Type: text/html\r\n"
         f"Content-Length: {len(content)}\r\n"
-        f"Connection: close\r\n\r\n"
+        f"{extra_headers}"
+        f"{get_connection_header(keep_alive)}\r\n\r\n"
     )
-    return header.encode() + content
+    return Response(status_code, [header.encode() + content])
 
 
-def handle_request(connection_socket: socket.socket):
+# Serve requests from one connection until the client closes it, it stays idle for
+# keep_alive_timeout or max_requests have been served. Pipelined requests are
+# answered in order from the same receive buffer. `waiting` returns how many other
+# connections wait for a worker thread: while there are any, responses close the
+# connection and an idle one is given up instead of holding the thread
+def handle_request(
+    connection_socket: socket.socket,
+    keep_alive_timeout=KEEP_ALIVE_TIMEOUT,
+    max_requests=MAX_KEEP_ALIVE_REQUESTS,
+    waiting=lambda: 0,
+):
+    buffer = bytearray()
+    parser = RequestParser()
+    served = 0
     try:
-        request = connection_socket.recv(BUF_SIZE).decode("utf-8", errors="replace")
-        if not request:
-            logger.debug("Empty request received")
-            return
-        connection_socket.sendall(get_response(request))
+        idle_since = time.monotonic()
+        while served < max_requests:
+            request, consumed = parser.parse(buffer)
+            if request is None:
+                if served and not buffer and waiting():
+                    logger.debug("Closing an idle connection, others are waiting")
+                    return
+                connection_socket.settimeout(min(IDLE_POLL_INTERVAL, keep_alive_timeout))
+                try:
+                    chunk = connection_socket.recv(BUF_SIZE)
+                except socket.timeout:
+                    if time.monotonic() - idle_since >= keep_alive_timeout:
+                        raise
+                    continue
+                if not chunk:
+                    if buffer:
+                        logger.debug("Connection closed in the middle of a request")
+                    return
+                buffer += chunk
+                idle_since = time.monotonic()
+                continue
+
+            del buffer[:consumed]
+            served += 1
+            keep_alive = (
+                request.keep_alive
+                and served < max_requests
+                and not shutdown_event.is_set()
+                and not waiting()
+            )
+            started = time.perf_counter()
+            response = get_response(request, keep_alive)
+            connection_socket.settimeout(keep_alive_timeout)
+            response.send(connection_socket)
+            metrics.observe(
+                request.path, response.status_code, time.perf_counter() - started, response.length
+            )
+            if not keep_alive:
+                return
+            idle_since = time.monotonic()
+    except ParseError as e:
+        logger.warning(f"Rejecting request: {e.status_code} {e.message}")
+        response = build_error_response(e.status_code, e.message)
+        connection_socket.settimeout(keep_alive_timeout)
+        response.send(connection_socket)
+        metrics.observe(None, response.status_code, 0.0, response.length)
+        drain_before_close(connection_socket)
     except socket.timeout:
-        logger.warning("Request timed out")
+        logger.debug(f"Connection idle for {keep_alive_timeout} s, closing")
     except Exception as e:
         logger.error(f"Error handling request: {e}", exc_info=True)
 
 
-def client_handler(connection_socket, addr, connection_semaphore):
+# Stop sending and read what is left of a rejected request, so closing the socket does
+# not reset the connection before the client has read the error response
+def drain_before_close(connection_socket):
     try:
-        # connection_socket.settimeout(5)
+        connection_socket.shutdown(socket.SHUT_WR)
+        deadline = time.monotonic() + LINGER_TIMEOUT
+        while (remaining := deadline - time.monotonic()) > 0:
+            connection_socket.settimeout(remaining)
+            if not connection_socket.recv(BUF_SIZE):
+                return
+    except OSError:
+        pass
+
+
+def client_handler(connection_socket, addr, keep_alive_timeout, max_requests, waiting=lambda: 0):
+    metrics.connection_opened()
+    if log_connections:
         logger.info(f"[{addr[0]}:{addr[1]}] Handling connection...")
 
-        try:
-            handle_request(connection_socket)
+    try:
+        handle_request(connection_socket, keep_alive_timeout, max_requests, waiting)
+        if log_connections:
             logger.info(
                 f"[{addr[0]}:{addr[1]}] Request has been processed. Closing connection..."
             )
-        except Exception as e:
-            logger.error(f"Error handling connection: {e}", exc_info=True)
-        finally:
-            logger.info(f"[{addr[0]}:{addr[1]}] Connection closed")
-            try:
-                connection_socket.close()
-            except:
-                pass
+    except Exception as e:
+        logger.error(f"Error handling connection: {e}", exc_info=True)
     finally:
-        connection_semaphore.release()
+        metrics.connection_closed()
+        if log_connections:
+            logger.info(f"[{addr[0]}:{addr[1]}] Connection closed")
+        try:
+            connection_socket.close()
+        except:
+            pass
 
 
-def run_server(port: int, concurrency_level: int):
+# Answer a connection the pool has no room for without blocking the accept loop.
+# Whatever the client already sent is read first, closing a socket with unread data
+# would reset the connection before the 503 reaches the client
+def reject_connection(connection_socket):
     try:
-        connection_semaphore = threading.Semaphore(concurrency_level)
+        connection_socket.setblocking(False)
+        try:
+            connection_socket.recv(BUF_SIZE)
+        except BlockingIOError:
+            pass
+        connection_socket.send(
+            build_error_response(
+                503, "Service Unavailable", extra_headers=f"Retry-After: {RETRY_AFTER}\r\n"
+            ).parts[0]
+        )
+    except OSError:
+        pass
+    finally:
+        connection_socket.close()
 
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        server_socket.bind(("", port))
-        server_socket.listen(concurrency_level)
 
-        logger.info(
-            f"Server started on port {port} with concurrency level {concurrency_level}"
-        )
-        logger.info(f"Serving files from directory: {Path.cwd() / DATA_DIR}")
+def create_server_socket(port: int, backlog: int, reuse_port=False):
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        # Every worker binds its own socket, the kernel spreads connections between them
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    server_socket.bind(("", port))
+    server_socket.listen(backlog)
+    return server_socket
 
-        while True:
-            try:
-                connection_socket, addr = server_socket.accept()
+
+# Connections are queued for a fixed pool of concurrency_level threads. When queue_size
+# connections are already waiting, new ones get a 503 instead of stalling the listener
+def serve_threads(server_socket, concurrency_level, keep_alive_timeout, max_requests, queue_size):
+    global worker_pool
+    worker_pool = pool = WorkerPool(
+        concurrency_level,
+        queue_size,
+        lambda connection_socket, addr: client_handler(
+            connection_socket, addr, keep_alive_timeout, max_requests, pool.waiting
+        ),
+    )
+    pool.start()
+    # Wake up regularly to notice a shutdown request
+    server_socket.settimeout(1.0)
+
+    while not shutdown_event.is_set():
+        try:
+            connection_socket, addr = server_socket.accept()
+            if log_connections:
                 logger.info(f"[{addr[0]}:{addr[1]}] Connection established")
 
-                if connection_semaphore.acquire():
-                    client_thread = threading.Thread(
-                        target=client_handler,
-                        args=(connection_socket, addr, connection_semaphore),
-                    )
-                    client_thread.daemon = True
-                    client_thread.start()
+            if not pool.submit((connection_socket, addr)):
+                logger.warning(f"[{addr[0]}:{addr[1]}] Queue is full, rejecting connection")
+                reject_connection(connection_socket)
+
+        except socket.timeout:
+            continue
+        except Exception as e:
+            logger.error(f"Error accepting connection: {e}", exc_info=True)
+
+    logger.info("Shutting down, draining connections")
+    if not pool.stop(GRACEFUL_TIMEOUT):
+        logger.warning("Connections still open after the graceful timeout")
+    logger.info(f"Worker pool: {pool.stats()}")
 
-            except Exception as e:
-                logger.error(f"Error accepting connection: {e}", exc_info=True)
+
+def request_shutdown(signum, frame):
+    shutdown_event.set()
+
+
+def run_server(
+    port: int,
+    concurrency_level: int,
+    keep_alive_timeout=KEEP_ALIVE_TIMEOUT,
+    max_requests=MAX_KEEP_ALIVE_REQUESTS,
+    engine="threads",
+    max_connections=MAX_CONNECTIONS,
+    file_cache_size=FILE_CACHE_SIZE,
+    file_cache_revalidate=FILE_CACHE_REVALIDATE,
+    compressed_cache_size=COMPRESSED_CACHE_SIZE,
+    queue_size=QUEUE_SIZE,
+    connection_log=True,
+    reuse_port=False,
+):
+    global log_connections
+    log_connections = connection_log
+    file_cache.max_size = file_cache_size
+    file_cache.revalidate = file_cache_revalidate
+    compressed_cache.max_size = compressed_cache_size
+    try:
+        server_socket = create_server_socket(port, socket.SOMAXCONN, reuse_port)
+        if engine == "selectors":
+            logger.info(
+                f"Server started on port {port} with an event loop for up to {max_connections} connections"
+            )
+        else:
+            logger.info(
+                f"Server started on port {port} with concurrency level {concurrency_level} "
+                f"and a queue of {queue_size} connections"
+            )
+        logger.info(f"Serving files from directory: {Path.cwd() / DATA_DIR}")
+
+        if engine == "selectors":
+            EventLoopServer(
+                server_socket,
+                get_response,
+                build_error_response,
+                keep_alive_timeout,
+                max_requests,
+                max_connections,
+                shutdown_event,
+                metrics,
+                log_connections,
+            ).serve_forever()
+        else:
+            serve_threads(
+                server_socket, concurrency_level, keep_alive_timeout, max_requests, queue_size
+            )
 
     except KeyboardInterrupt:
         logger.info("Server stopped by user: KeyboardInterrupt")
     except Exception as e:
         logger.critical(f"Server error: {e}", exc_info=True)
     finally:
+        logger.info(f"File cache: {file_cache.stats()}")
+        logger.info(f"Compressed cache: {compressed_cache.stats()}")
         try:
             server_socket.close()
             logger.info("Server socket closed")
@@ -171,11 +648,12 @@ def run_server(port: int, concurrency_level: int):
 
 if __name__ == "__main__":
     args = parse_arguments()
-    logger = logging.getLogger(__name__)
 
     logging.basicConfig(
         level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
+        format="%(asctime)s - %(process)d - %(levelname)s - %(message)s"
+        if args.workers
+        else "%(asctime)s - %(levelname)s - %(message)s",
         datefmt="%Y-%m-%d %H:%M:%S",
     )
 
@@ -183,6 +661,32 @@ if __name__ == "__main__":
 
     numeric_level = getattr(logging, args.log_level.upper(), None)
     if isinstance(numeric_level, int):
-        logger.setLevel(numeric_level)
+        logging.getLogger().setLevel(numeric_level)
+
+    server_args = (
+        args.server_port,
+        args.concurrency_level,
+        args.keep_alive_timeout,
+        args.max_keep_alive_requests,
+        args.engine,
+        args.max_connections,
+        args.file_cache_size,
+        args.file_cache_revalidate,
+        args.compressed_cache_size,
+        args.queue_size,
+        args.connection_log,
+    )
+
+    if args.workers:
+
+        def run_worker():
+            # Only the master reacts to Ctrl+C and hangups, workers are stopped by it
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, request_shutdown)
+            run_server(*server_args, reuse_port=True)
 
-    run_server(args.server_port, args.concurrency_level)
+        Supervisor(args.workers, run_worker).run()
+    else:
+        signal.signal(signal.SIGTERM, request_shutdown)
+        run_server(*server_args)
@@ -0,0 +1,120 @@
+import logging
+import os
+import signal
+import time
+
+from const import GRACEFUL_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Workers exiting sooner than this after start are respawned with a delay, so a worker
+# that cannot start (e.g. the port is taken) does not make the master spin
+MIN_WORKER_LIFETIME = 1.0
+POLL_INTERVAL = 0.2
+
+
+# Pre-fork master: runs `target` in `count` child processes and replaces those that die.
+# SIGHUP starts a new generation of workers and gracefully stops the old one with SIGTERM,
+# SIGTERM/SIGINT stop all workers and then the master
+class Supervisor:
+    def __init__(self, count, target, graceful_timeout=GRACEFUL_TIMEOUT):
+        self.count = count
+        self.target = target
+        self.graceful_timeout = graceful_timeout
+        self.workers = {}  # pid -> (generation, start time)
+        self.generation = 0
+        self._restart = False
+        self._stop = False
+
+    def run(self):
+        signal.signal(signal.SIGHUP, self._request_restart)
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        logger.info(f"Master {os.getpid()} starting {self.count} workers")
+        for _ in range(self.count):
+            self._spawn()
+
+        while not self._stop:
+            self._reap()
+            if self._restart:
+                self._restart = False
+                self._rotate()
+            time.sleep(POLL_INTERVAL)
+
+        self._stop_workers(list(self.workers))
+        logger.info("Master stopped")
+
+    def _request_restart(self, signum, frame):
+        self._restart = True
+
+    def _request_stop(self, signum, frame):
+        self._stop = True
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self.target()
+            except BaseException:
+                logger.exception("Worker failed")
+                code = 1
+            finally:
+                logging.shutdown()
+                os._exit(code)
+        self.workers[pid] = (self.generation, time.monotonic())
+        logger.info(f"Started worker {pid}")
+
+    def _reap(self):
+        while self.workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            generation, started = self.workers.pop(pid, (None, 0))
+            code = os.waitstatus_to_exitcode(status)
+            if generation != self.generation or self._stop:
+                logger.info(f"Worker {pid} of generation {generation} stopped")
+                continue
+            logger.warning(f"Worker {pid} exited with status {code}, starting a new one")
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                time.sleep(MIN_WORKER_LIFETIME)
+            self._spawn()
+
+    # New workers start accepting next to the old ones before those are asked to stop,
+    # so the port is never left without a listener
+    def _rotate(self):
+        old = [pid for pid, (generation, _) in self.workers.items() if generation == self.generation]
+        self.generation += 1
+        logger.info(f"Restarting workers, generation {self.generation}")
+        for _ in range(self.count):
+            self._spawn()
+        for pid in old:
+            self._signal(pid, signal.SIGTERM)
+
+    def _stop_workers(self, pids):
+        for pid in pids:
+            self._signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 1
+        while self.workers and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                time.sleep(POLL_INTERVAL)
+            else:
+                self.workers.pop(pid, None)
+        for pid in list(self.workers):
+            logger.warning(f"Killing worker {pid}")
+            self._signal(pid, signal.SIGKILL)
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+            self.workers.pop(pid)
+
+    def _signal(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
@@ -0,0 +1,91 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Fixed set of pre-started threads running `handler(*job)` for jobs taken from a bounded
+# queue. submit() never blocks: a full queue is reported to the caller, which sheds the load
+class WorkerPool:
+    def __init__(self, size, queue_size, handler):
+        self.handler = handler
+        self.queue = queue.Queue(queue_size)
+        self.threads = [threading.Thread(target=self._work, daemon=True) for _ in range(size)]
+        self.submitted = 0
+        self.rejected = 0
+        self.started = 0
+        self.busy = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, job):
+        try:
+            self.queue.put_nowait((job, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    # Queued jobs no idle worker is about to take. A job stays in the queue for a moment
+    # after submit() even when a worker is free, so the queue depth alone overstates it
+    def waiting(self):
+        with self._lock:
+            idle = len(self.threads) - self.busy
+        return max(0, self.queue.qsize() - idle)
+
+    # Let the workers finish queued jobs, then wait up to `timeout` seconds for them
+    def stop(self, timeout):
+        deadline = time.monotonic() + timeout
+        try:
+            for _ in self.threads:
+                self.queue.put(None, timeout=max(0, deadline - time.monotonic()))
+        except queue.Full:
+            pass
+        for thread in self.threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in self.threads)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": len(self.threads),
+                "busy_workers": self.busy,
+                "queue_depth": self.queue.qsize(),
+                "max_queue_depth": self.max_depth,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.total_wait / self.started * 1000, 3) if self.started else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+            }
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            job, submitted_at = item
+            wait = time.monotonic() - submitted_at
+            with self._lock:
+                self.started += 1
+                self.busy += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            try:
+                self.handler(*job)
+            except Exception as e:
+                logger.error(f"Error in worker: {e}", exc_info=True)
+            finally:
+                with self._lock:
+                    self.busy -= 1
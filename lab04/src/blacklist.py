@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+
+from const import BLACKLIST_PATH, BLACKLIST_RECHECK
+from helpers import get_blacklist_entries
+
+
+def split_scheme(url):
+    scheme, separator, rest = url.partition("://")
+    return (scheme, rest) if separator else (None, url)
+
+
+# Blacklist entries compiled for lookups that do not depend on their number. A domain
+# blocks itself and its subdomains: the host and each of its parent domains are looked up
+# in a set. A URL blocks every URL it is a prefix of, without a scheme it blocks both
+# http and https; URL entries are indexed by host, so only the host's entries are compared
+class BlacklistMatcher:
+    def __init__(self, entries):
+        self.domains = set()
+        self.urls = {}  # host -> [(scheme or None, URL without the scheme)]
+        for entry in entries:
+            scheme, rest = split_scheme(entry.lower())
+            if scheme is None and "/" not in rest and ":" not in rest:
+                if rest.strip("."):
+                    self.domains.add(rest.strip("."))
+            else:
+                host = rest.split("/", 1)[0].split(":", 1)[0]
+                self.urls.setdefault(host, []).append((scheme, rest))
+
+    def is_blocked(self, hostname, target):
+        hostname = hostname.lower().rstrip(".")
+        labels = hostname.split(".")
+        for i in range(len(labels)):
+            if ".".join(labels[i:]) in self.domains:
+                return True
+
+        entries = self.urls.get(hostname)
+        if entries:
+            scheme, rest = split_scheme(target.lower())
+            for entry_scheme, entry_rest in entries:
+                if entry_scheme in (None, scheme) and rest.startswith(entry_rest):
+                    return True
+        return False
+
+
+# The blacklist file compiled once and again only when it changes. Its mtime and size
+# are checked at most every `recheck` seconds; a file that cannot be read keeps the
+# entries compiled before
+class Blacklist:
+    def __init__(self, logger, path=BLACKLIST_PATH, recheck=BLACKLIST_RECHECK):
+        self.logger = logger
+        self.path = path
+        self.recheck = recheck
+        self.matcher = BlacklistMatcher([])
+        self._version = None  # (mtime, size) the matcher was compiled from
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._reload()
+
+    def is_blocked(self, hostname, target):
+        if time.monotonic() - self._checked >= self.recheck:
+            self._reload()
+        return self.matcher.is_blocked(hostname, target)
+
+    def _reload(self):
+        # One thread checks, the others keep using the current matcher meanwhile
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._checked = time.monotonic()
+            try:
+                stat = os.stat(self.path)
+                version = (stat.st_mtime_ns, stat.st_size)
+                if version == self._version:
+                    return
+                matcher = BlacklistMatcher(get_blacklist_entries(self.path))
+            except OSError as e:
+                self.logger.error(f"Could not load blacklist {self.path}: {e}")
+                return
+            self.matcher = matcher
+            self._version = version
+            self.logger.info(
+                f"Loaded blacklist {self.path}: {len(matcher.domains)} domains, "
+                f"{sum(len(urls) for urls in matcher.urls.values())} URLs"
+            )
+        finally:
+            self._lock.release()
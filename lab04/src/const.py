@@ -1,3 +1,9 @@
-BUF_SIZE = 4096
+BUF_SIZE = 64 * 1024
 CACHE_DIR = "cache"
 BLACKLIST_PATH = "blacklist.conf"
+UPSTREAM_TIMEOUT = 10
+UPSTREAM_MAX_PER_HOST = 8
+UPSTREAM_IDLE_TIMEOUT = 30
+MAX_CHUNK_LINE = 8192
+BLACKLIST_RECHECK = 1.0
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
@@ -2,7 +2,7 @@ import hashlib
 import os
 from urllib.parse import urlparse
 
-from const import BLACKLIST_PATH, CACHE_DIR
+from const import BLACKLIST_PATH, CACHE_DIR, MAX_CHUNK_LINE
 
 
 def parse_http_request(request_data):
@@ -74,12 +74,87 @@ def build_remote_request(method, remote_path, version, header_lines, hostname, b
     if not host_header_present:
         new_headers.append(f"Host: {hostname}")
 
-    new_headers.append("Connection: close")
+    new_headers.append("Connection: keep-alive")
 
     request_message = new_request_line + "\r\n".join(new_headers) + "\r\n\r\n"
     return request_message.encode() + body
 
 
+# Status code and headers (lowercase name -> value) of an upstream response head
+def parse_response_head(head_data):
+    lines = head_data.decode("latin-1").split("\r\n")
+    status_parts = lines[0].split()
+    response_code = status_parts[1] if len(status_parts) >= 2 else "N/A"
+
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    return response_code, headers
+
+
+# Whether the origin keeps the connection open after this response
+def is_persistent_response(head_data, headers):
+    connection = headers.get("connection", "").lower()
+    if "close" in connection:
+        return False
+    return head_data.startswith(b"HTTP/1.1") or "keep-alive" in connection
+
+
+# The proxy closes the client connection after one response, so the client is told so
+# instead of seeing the origin's connection headers
+def rewrite_response_head(head_data):
+    lines = [
+        line
+        for line in head_data.split(b"\r\n")
+        if line.split(b":", 1)[0].strip().lower()
+        not in (b"connection", b"keep-alive", b"proxy-connection")
+    ]
+    lines.append(b"Connection: close")
+    return b"\r\n".join(lines) + b"\r\n\r\n"
+
+
+# Finds where a chunked body ends in the raw byte stream. The bytes are relayed as they
+# are, only the chunk size lines and the trailer are parsed
+class ChunkedFramer:
+    def __init__(self):
+        self.done = False
+        self._line = bytearray()  # partial size or trailer line
+        self._remaining = 0  # bytes of chunk data and its CRLF still to skip
+        self._trailer = False
+
+    # Returns how many bytes of `data` belong to the body, the rest follows its end.
+    # Raises ValueError on a malformed chunk size
+    def feed(self, data):
+        position = 0
+        while position < len(data) and not self.done:
+            if self._remaining:
+                step = min(self._remaining, len(data) - position)
+                self._remaining -= step
+                position += step
+                continue
+            end = data.find(b"\n", position)
+            if end == -1:
+                self._line += data[position:]
+                if len(self._line) > MAX_CHUNK_LINE:
+                    raise ValueError("Chunk size line too long")
+                return len(data)
+            self._line += data[position:end]
+            position = end + 1
+            line = bytes(self._line).strip()
+            self._line.clear()
+            if self._trailer:
+                self.done = not line
+            else:
+                size = int(line.split(b";", 1)[0], 16)
+                if size:
+                    self._remaining = size + 2
+                else:
+                    self._trailer = True
+        return position
+
+
 def get_cache_paths(url):
     h = hashlib.md5(url.encode()).hexdigest()
     meta_path = os.path.join(CACHE_DIR, f"{h}.meta")
@@ -1,20 +1,31 @@
 import json
 import os
 import socket
+import tempfile
 import threading
-from const import BUF_SIZE, CACHE_DIR
+from blacklist import Blacklist
+from const import BUF_SIZE, CACHE_DIR, IDEMPOTENT_METHODS, UPSTREAM_TIMEOUT
 from helpers import (
+    ChunkedFramer,
     build_remote_request,
     extract_target_info,
-    get_blacklist_entries,
     get_cache_paths,
+    is_persistent_response,
     parse_http_request,
+    parse_response_head,
+    rewrite_response_head,
 )
 from setup import init_logger, parse_arguments
+from upstream_pool import UpstreamPool
+
+upstream_pool = None
+blacklist = None
 
 
 def handle_request(connection_socket: socket.socket):
     remote_socket = None
+    upstream = None
+    reusable = False
 
     try:
         # Read the complete client request
@@ -58,21 +69,19 @@ def handle_request(connection_socket: socket.socket):
             connection_socket.sendall(b"HTTP/1.1 400 Bad Request\r\n\r\n")
             return
 
-        blacklist = get_blacklist_entries()
-        for blocked in blacklist:
-            if blocked.lower() in target.lower():
-                logger.warning(f"Blocked request: {target} is blacklisted")
-                block_response = (
-                    "HTTP/1.1 403 Forbidden\r\n"
-                    "Content-Type: text/html\r\n"
-                    "Connection: close\r\n"
-                    "\r\n"
-                    "<html><body><h1>Access Blocked</h1>"
-                    "<p>This page is blocked by the proxy server.</p>"
-                    "</body></html>"
-                )
-                connection_socket.sendall(block_response.encode())
-                return
+        if blacklist.is_blocked(hostname, target):
+            logger.warning(f"Blocked request: {target} is blacklisted")
+            block_response = (
+                "HTTP/1.1 403 Forbidden\r\n"
+                "Content-Type: text/html\r\n"
+                "Connection: close\r\n"
+                "\r\n"
+                "<html><body><h1>Access Blocked</h1>"
+                "<p>This page is blocked by the proxy server.</p>"
+                "</body></html>"
+            )
+            connection_socket.sendall(block_response.encode())
+            return
 
         logger.info(f"Proxying {method} request to {hostname}:{port}{remote_path}")
 
@@ -98,62 +107,38 @@ def handle_request(connection_socket: socket.socket):
             method, remote_path, version, header_lines, hostname, body
         )
 
-        # Connect to the remote server and send the request
+        # Send the request over a pooled connection to the remote server
+        upstream = (hostname, port)
         try:
-            remote_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            remote_socket.settimeout(10)
-            remote_socket.connect((hostname, port))
-            remote_socket.sendall(final_request)
-
-            response_data = b""
-            while True:
-                chunk = remote_socket.recv(BUF_SIZE)
-                if not chunk:
-                    break
-                response_data += chunk
-
-            response_lines = response_data.split(b"\r\n")
-            if response_lines:
-                status_line = response_lines[0].decode(errors="ignore")
-                status_parts = status_line.split()
-                response_code = status_parts[1] if len(status_parts) >= 2 else "N/A"
-            else:
-                response_code = "N/A"
+            remote_socket, received, response_code, headers = send_upstream(
+                upstream, final_request, method
+            )
 
             # If we did a conditional GET and got a 304, serve the cached copy
             if response_code == "304" and meta_exists:
                 logger.info(f"Serving {target} from cache (304 Not Modified)")
                 with open(content_path, "rb") as cache_file:
-                    cached_response = cache_file.read()
-                connection_socket.sendall(cached_response)
+                    connection_socket.sendfile(cache_file)
+                reusable = received.endswith(b"\r\n\r\n") and is_persistent_response(
+                    received, headers
+                )
             else:
-                # If everything's good, update the cache
-                if method.upper() == "GET" and response_code == "200":
-                    header_data, _, _ = response_data.partition(b"\r\n\r\n")
-                    headers = header_data.decode("utf-8", errors="replace").split(
-                        "\r\n"
-                    )
-                    new_meta = {}
-                    for header in headers:
-                        if header.lower().startswith("last-modified:"):
-                            new_meta["Last-Modified"] = header.split(":", 1)[1].strip()
-                        elif header.lower().startswith("etag:"):
-                            new_meta["Etag"] = header.split(":", 1)[1].strip()
-
-                    # Save metadata and the full response to cache
-                    meta_path, content_path = get_cache_paths(target)
-                    with open(meta_path, "w") as meta_file:
-                        json.dump(new_meta, meta_file)
-                    with open(content_path, "wb") as cache_file:
-                        cache_file.write(response_data)
-                    logger.info(f"Cached {target}")
-
-                # Send the cached/new response to the client
-                connection_socket.sendall(response_data)
+                cacheable = method.upper() == "GET" and response_code == "200"
+                reusable = relay_response(
+                    remote_socket,
+                    connection_socket,
+                    received,
+                    method,
+                    response_code,
+                    headers,
+                    target,
+                    cacheable,
+                )
 
             logger.info(
                 f"Proxied request: {target} with response code: {response_code}"
             )
+            logger.debug(f"Upstream pool: {upstream_pool.stats()}")
 
         except socket.timeout:
             logger.error(f"Connection to {hostname}:{port} timed out")
@@ -185,10 +170,160 @@ def handle_request(connection_socket: socket.socket):
             pass
     finally:
         if remote_socket:
-            try:
-                remote_socket.close()
-            except Exception:
-                pass
+            upstream_pool.release(upstream, remote_socket, reusable)
+
+
+# Receive upstream data up to the end of the response head. Returns the bytes received
+# so far (the head and the start of the body), the status code and the headers
+def read_response_head(remote_socket: socket.socket):
+    received = bytearray()
+    while True:
+        chunk = remote_socket.recv(BUF_SIZE)
+        if not chunk:
+            break
+        # The terminator may straddle the previous chunk
+        start = max(0, len(received) - 3)
+        received += chunk
+        if received.find(b"\r\n\r\n", start) != -1:
+            break
+
+    header_data = received.partition(b"\r\n\r\n")[0]
+    response_code, headers = parse_response_head(bytes(header_data))
+    return received, response_code, headers
+
+
+# Send the request over a pooled connection and receive the response head. A reused
+# connection may have been closed by the origin in the meantime, then the request is
+# retried once on a new one: always if sending it failed, otherwise only for idempotent
+# methods, as the origin may already have acted on it. Returns the socket, which the
+# caller releases, and what read_response_head() returns
+def send_upstream(upstream, request, method):
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+    fresh = False
+    while True:
+        remote_socket, reused = upstream_pool.acquire(upstream, fresh)
+        sent = False
+        try:
+            remote_socket.sendall(request)
+            sent = True
+            received, response_code, headers = read_response_head(remote_socket)
+        except socket.timeout:
+            upstream_pool.release(upstream, remote_socket, False)
+            raise
+        except OSError:
+            upstream_pool.release(upstream, remote_socket, False)
+            if not reused or (sent and not idempotent):
+                raise
+            received = None
+        if received or not reused:
+            return remote_socket, received, response_code, headers
+        if received is not None:
+            upstream_pool.release(upstream, remote_socket, False)
+            if not idempotent:
+                raise ConnectionResetError(
+                    f"Reused connection to {upstream[0]}:{upstream[1]} closed without a response"
+                )
+        logger.debug(f"Reused connection to {upstream[0]}:{upstream[1]} was closed, retrying")
+        fresh = True
+
+
+# Relay the rest of the upstream response to the client chunk by chunk as it arrives.
+# The body ends where Content-Length or the chunked encoding says, so the upstream
+# connection can carry the next request; only a response framed by neither is read
+# up to EOF. A cacheable response is written to temporary files on the way and moved
+# into the cache only once it was received completely, so a cut off download never
+# replaces an entry. Returns whether the upstream connection can be reused
+def relay_response(
+    remote_socket, connection_socket, received, method, response_code, headers, target, cacheable
+):
+    head_end = received.find(b"\r\n\r\n")
+    if head_end == -1:
+        # The origin closed the connection before the end of the head, pass on what came
+        connection_socket.sendall(received)
+        return False
+    head = rewrite_response_head(bytes(received[:head_end]))
+    chunk = received[head_end + 4 :]
+
+    framer = None
+    body_left = None  # None while the body ends at EOF
+    if method.upper() == "HEAD" or response_code[:1] == "1" or response_code in ("204", "304"):
+        body_left = 0
+    elif "chunked" in headers.get("transfer-encoding", "").lower():
+        framer = ChunkedFramer()
+    elif headers.get("content-length", "").isdigit():
+        body_left = int(headers["content-length"])
+    reusable = (framer or body_left is not None) and is_persistent_response(received, headers)
+
+    cache_file = None
+    if cacheable:
+        fd, content_tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        cache_file = os.fdopen(fd, "wb")
+
+    complete = False
+    try:
+        connection_socket.sendall(head)
+        if cache_file:
+            cache_file.write(head)
+        while True:
+            if framer:
+                used = framer.feed(chunk)
+                finished = framer.done
+            elif body_left is not None:
+                used = min(len(chunk), body_left)
+                body_left -= used
+                finished = not body_left
+            else:
+                used = len(chunk)
+                finished = False
+            if used < len(chunk):
+                logger.warning(f"{target}: the origin sent data past the end of the response")
+                reusable = False
+                chunk = chunk[:used]
+            if chunk:
+                connection_socket.sendall(chunk)
+                if cache_file:
+                    cache_file.write(chunk)
+            if finished:
+                complete = True
+                break
+            chunk = remote_socket.recv(BUF_SIZE)
+            if not chunk:
+                complete = framer is None and body_left is None
+                reusable = False
+                break
+    except (OSError, ValueError) as e:
+        logger.warning(f"Relaying {target} interrupted: {e}")
+        reusable = False
+
+    if not cache_file:
+        return reusable and complete
+    meta_tmp = None
+    try:
+        cache_file.close()
+        if not complete:
+            logger.warning(f"Not caching {target}: the response is incomplete")
+            return False
+
+        new_meta = {}
+        if "last-modified" in headers:
+            new_meta["Last-Modified"] = headers["last-modified"]
+        if "etag" in headers:
+            new_meta["Etag"] = headers["etag"]
+
+        # Content first: an old meta next to new content only costs a full download,
+        # new validators next to old content would serve it stale on a 304
+        meta_path, content_path = get_cache_paths(target)
+        fd, meta_tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w") as meta_file:
+            json.dump(new_meta, meta_file)
+        os.replace(content_tmp, content_path)
+        os.replace(meta_tmp, meta_path)
+        logger.info(f"Cached {target}")
+        return reusable
+    finally:
+        for path in (content_tmp, meta_tmp):
+            if path and os.path.exists(path):
+                os.remove(path)
 
 
 def client_handler(connection_socket, addr, connection_semaphore):
@@ -208,9 +343,20 @@ def client_handler(connection_socket, addr, connection_semaphore):
         connection_semaphore.release()
 
 
-def run_server(port: int, concurrency_level: int):
+def run_server(
+    port: int,
+    concurrency_level: int,
+    upstream_max_per_host: int,
+    upstream_idle_timeout: float,
+):
+    global upstream_pool, blacklist
+
     try:
         os.makedirs(CACHE_DIR, exist_ok=True)
+        blacklist = Blacklist(logger)
+        upstream_pool = UpstreamPool(
+            upstream_max_per_host, upstream_idle_timeout, UPSTREAM_TIMEOUT
+        )
 
         connection_semaphore = threading.Semaphore(concurrency_level)
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -244,6 +390,7 @@ def run_server(port: int, concurrency_level: int):
         try:
             server_socket.close()
             logger.info("Server socket closed")
+            upstream_pool.close()
         except:
             pass
 
@@ -255,4 +402,9 @@ if __name__ == "__main__":
     print(f"Running with arguments: {args}")
     print(f"Logs will be saved to {args.log_file}")
 
-    run_server(args.server_port, args.concurrency_level)
+    run_server(
+        args.server_port,
+        args.concurrency_level,
+        args.upstream_max_per_host,
+        args.upstream_idle_timeout,
+    )
@@ -1,6 +1,8 @@
 import argparse
 import logging
 
+from const import UPSTREAM_IDLE_TIMEOUT, UPSTREAM_MAX_PER_HOST
+
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="proxy server for lab04")
@@ -13,6 +15,18 @@ def parse_arguments():
         default=1,
         help="maximum number of concurrent connections",
     )
+    parser.add_argument(
+        "--upstream_max_per_host",
+        type=int,
+        default=UPSTREAM_MAX_PER_HOST,
+        help="maximum number of open connections to one origin server",
+    )
+    parser.add_argument(
+        "--upstream_idle_timeout",
+        type=float,
+        default=UPSTREAM_IDLE_TIMEOUT,
+        help="seconds an idle connection to an origin server is kept open",
+    )
     parser.add_argument(
         "--log_level",
         type=str,
@@ -0,0 +1,109 @@
+import select
+import socket
+import threading
+import time
+
+
+# Persistent connections to origin servers, kept per (host, port). At most max_per_host
+# connections to one origin are open at a time, idle ones included; acquire() waits for a
+# free slot up to the connect timeout. Idle connections are closed after idle_timeout
+class UpstreamPool:
+    def __init__(self, max_per_host, idle_timeout, timeout):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.idle = {}  # (host, port) -> [(socket, idle since)], most recently used last
+        self.open = {}  # (host, port) -> open connections, idle ones included
+        self.reused = 0
+        self.created = 0
+        self._condition = threading.Condition()
+
+    # Returns (socket, True if it was reused). With `fresh` an idle connection is never
+    # reused, for retrying a request that failed on one
+    def acquire(self, upstream, fresh=False):
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                self._expire()
+                idle = self.idle.get(upstream, [])
+                while idle and not fresh:
+                    sock, _ = idle.pop()
+                    if self._healthy(sock):
+                        self.reused += 1
+                        return sock, True
+                    self._discard(upstream, sock)
+                if self.open.get(upstream, 0) < self.max_per_host:
+                    self.open[upstream] = self.open.get(upstream, 0) + 1
+                    break
+                if idle:
+                    # Only `fresh` gets here: make room by closing the oldest idle one
+                    self._discard(upstream, idle.pop(0)[0])
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout(f"No free connection to {upstream[0]}:{upstream[1]}")
+                self._condition.wait(remaining)
+
+        try:
+            sock = socket.create_connection(upstream, timeout=self.timeout)
+        except BaseException:
+            with self._condition:
+                self._forget(upstream)
+            raise
+        with self._condition:
+            self.created += 1
+        return sock, False
+
+    # Every acquired socket is released exactly once. Reusable ones are kept idle,
+    # the rest are closed
+    def release(self, upstream, sock, reusable):
+        with self._condition:
+            if reusable:
+                self.idle.setdefault(upstream, []).append((sock, time.monotonic()))
+                self._condition.notify()
+                return
+            self._forget(upstream)
+        sock.close()
+
+    def close(self):
+        with self._condition:
+            for upstream, idle in self.idle.items():
+                for sock, _ in idle:
+                    self._discard(upstream, sock)
+            self.idle.clear()
+
+    def stats(self):
+        with self._condition:
+            return {
+                "open": sum(self.open.values()),
+                "idle": sum(len(idle) for idle in self.idle.values()),
+                "created": self.created,
+                "reused": self.reused,
+            }
+
+    # An idle connection must have nothing to read: readable means the origin closed
+    # it or sent bytes that belong to no request
+    def _healthy(self, sock):
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def _expire(self):
+        oldest = time.monotonic() - self.idle_timeout
+        for upstream, idle in list(self.idle.items()):
+            while idle and idle[0][1] < oldest:
+                self._discard(upstream, idle.pop(0)[0])
+            if not idle:
+                del self.idle[upstream]
+
+    def _discard(self, upstream, sock):
+        self._forget(upstream)
+        sock.close()
+
+    def _forget(self, upstream):
+        self.open[upstream] -= 1
+        if not self.open[upstream]:
+            del self.open[upstream]
+        self._condition.notify()